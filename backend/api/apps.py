@@ -1,6 +1,20 @@
+import atexit
+
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        import api.signals  # noqa: F401
+        from api.exports import register_fonts
+        from api.metrics import install_query_timer, registry
+
+        register_fonts()
+        if settings.METRICS_ENABLED:
+            connection_created.connect(install_query_timer)
+            atexit.register(registry.flush)
@@ -0,0 +1,137 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import response
+
+from api.metrics import registry
+
+RECIPES_CACHE = "recipes"
+
+
+def get_generation(name, alias=RECIPES_CACHE):
+    "Текущее поколение данных с именем name."
+
+    cache = caches[alias]
+    key = f"{name}:generation"
+    generation = cache.get(key)
+    if generation is not None:
+        return generation
+    # При потере счётчика (вытеснение, рестарт) поколение начинается
+    # со значения времени, чтобы не совпасть со старыми ключами.
+    cache.add(key, time.time_ns(), timeout=None)
+    return cache.get(key)
+
+
+def bump_generation(name, alias=RECIPES_CACHE):
+    "Переход к новому поколению данных: старые ключи становятся недоступны."
+
+    cache = caches[alias]
+    key = f"{name}:generation"
+    try:
+        return cache.incr(key)
+    except ValueError:
+        generation = time.time_ns()
+        cache.set(key, generation, timeout=None)
+        return generation
+
+
+class ResponseCache:
+    """Кэш данных ответов, сбрасываемый переходом к новому поколению.
+
+    Попадания и промахи учитываются в метриках запросов (api.metrics):
+    счётчики в самом кэше при LocMemCache видны только своему процессу.
+    """
+
+    def __init__(self, namespace, alias=RECIPES_CACHE):
+        self.namespace = namespace
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def make_key(self, request):
+        "Ключ ответа: адрес запроса с упорядоченными параметрами."
+
+        query = urlencode(
+            sorted(
+                (param, sorted(values))
+                for param, values in request.GET.lists()
+            ),
+            doseq=True,
+        )
+        url = request.build_absolute_uri(request.path) + "?" + query
+        digest = hashlib.md5(url.encode()).hexdigest()
+        generation = get_generation(self.namespace, self.alias)
+        return f"{self.namespace}:{generation}:{digest}"
+
+    def get(self, key):
+        data = self.cache.get(key)
+        if settings.METRICS_ENABLED:
+            registry.count_cache(
+                self.namespace, "hit" if data is not None else "miss"
+            )
+        return data
+
+    def set(self, key, data):
+        self.cache.set(key, data)
+
+    def invalidate(self):
+        # Сброс откладывается до фиксации транзакции, чтобы в кэш
+        # не попало состояние рецепта, записанное не полностью.
+        transaction.on_commit(
+            lambda: bump_generation(self.namespace, self.alias)
+        )
+
+    def stats(self):
+        "Попадания и промахи всех процессов из файлов метрик."
+
+        cache_results = registry.collect()[2]
+        hits = cache_results[(self.namespace, "hit")]
+        misses = cache_results[(self.namespace, "miss")]
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / total if total else 0.0,
+            "generation": get_generation(self.namespace, self.alias),
+        }
+
+
+recipe_cache = ResponseCache("recipes")
+
+
+class AnonymousCacheMixin:
+    "Кэширование list и retrieve для анонимных пользователей."
+
+    response_cache = recipe_cache
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if (
+            not settings.RECIPES_CACHE_ENABLED
+            or not request.user.is_anonymous
+        ):
+            return handler(request, *args, **kwargs)
+
+        key = self.response_cache.make_key(request)
+        data = self.response_cache.get(key)
+        if data is not None:
+            return response.Response(data, headers={"X-Cache": "HIT"})
+
+        result = handler(request, *args, **kwargs)
+        if result.status_code == 200:
+            self.response_cache.set(key, result.data)
+        result["X-Cache"] = "MISS"
+        return result
@@ -0,0 +1,163 @@
+import gzip
+import hashlib
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+import api.serializers as serializers
+from api.cache import RECIPES_CACHE, bump_generation, get_generation
+from recipes.models import Ingredient, Tag
+
+# Не чаще раза в столько секунд поколение справочника сверяется с кэшем:
+# запросы автодополнения не обращаются к кэшу на каждое нажатие клавиши.
+GENERATION_CHECK_INTERVAL = 1.0
+
+
+@dataclass(frozen=True)
+class CatalogPayload:
+    "Сериализованный справочник и его сжатая версия."
+
+    data: list
+    content: bytes
+    gzip_content: bytes
+    etag: str
+    generation: int
+    built_at: float
+
+
+class Catalog:
+    "Справочник, сериализуемый один раз и хранимый в памяти процесса."
+
+    def __init__(self, name, queryset, serializer_class):
+        self.name = name
+        self.queryset = queryset
+        self.serializer_class = serializer_class
+        self.payload = None
+        self.checked_at = float("-inf")
+        self.indexes = {}
+
+    @property
+    def generation_name(self):
+        return f"catalog:{self.name}"
+
+    @property
+    def max_age(self):
+        # Ограничивает устаревание, если бэкенд кэша не общий для
+        # процессов и поколение меняется только в одном из них.
+        return settings.CACHES[RECIPES_CACHE].get("TIMEOUT") or 300
+
+    def build(self, generation):
+        data = self.serializer_class(self.queryset.all(), many=True).data
+        content = JSONRenderer().render(data)
+        return CatalogPayload(
+            data=data,
+            content=content,
+            gzip_content=gzip.compress(content),
+            etag=f'"{hashlib.sha256(content).hexdigest()[:32]}"',
+            generation=generation,
+            built_at=time.monotonic(),
+        )
+
+    def get(self):
+        "Актуальная версия справочника; пересобирается при изменениях."
+
+        now = time.monotonic()
+        payload = self.payload
+        if (
+            payload is not None
+            and now - self.checked_at < GENERATION_CHECK_INTERVAL
+        ):
+            return payload
+        generation = get_generation(self.generation_name)
+        self.checked_at = now
+        if (
+            payload is None
+            or payload.generation != generation
+            or now - payload.built_at > self.max_age
+        ):
+            self.payload = self.build(generation)
+        return self.payload
+
+    def get_index(self, field):
+        "Отображение значений поля field в id по актуальной версии."
+
+        payload = self.get()
+        cached = self.indexes.get(field)
+        if cached is None or cached[0] is not payload:
+            cached = (payload, {row[field]: row["id"] for row in payload.data})
+            self.indexes[field] = cached
+        return cached[1]
+
+    def get_ids(self, field, values):
+        "id объектов со значениями поля field из values."
+
+        index = self.get_index(field)
+        ids = [index[value] for value in values if value in index]
+        missing = [value for value in values if value not in index]
+        if missing:
+            # Без общего кэша другой процесс узнаёт о новом объекте только
+            # через max_age: недостающие значения ищутся в базе.
+            ids.extend(
+                self.queryset.filter(**{f"{field}__in": missing}).values_list(
+                    "id", flat=True
+                )
+            )
+        return ids
+
+    def invalidate(self):
+        transaction.on_commit(self.bump)
+
+    def bump(self):
+        bump_generation(self.generation_name)
+        # Процесс, изменивший справочник, видит изменения сразу.
+        self.checked_at = float("-inf")
+
+    def response(self, request):
+        "Ответ со справочником с поддержкой ETag и gzip."
+
+        payload = self.get()
+        if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+        if if_none_match and (
+            payload.etag in parse_etags(if_none_match)
+            or if_none_match.strip() == "*"
+        ):
+            response = HttpResponseNotModified()
+        elif "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", ""):
+            response = HttpResponse(
+                payload.gzip_content, content_type="application/json"
+            )
+            response["Content-Encoding"] = "gzip"
+        else:
+            response = HttpResponse(
+                payload.content, content_type="application/json"
+            )
+        response["ETag"] = payload.etag
+        response["Cache-Control"] = "no-cache"
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
+
+
+tag_catalog = Catalog("tags", Tag.objects.all(), serializers.TagSerializer)
+ingredient_catalog = Catalog(
+    "ingredients", Ingredient.objects.all(), serializers.IngredientSerializer
+)
+
+
+class CatalogMixin:
+    "Отдача полного списка справочника из предсобранной версии."
+
+    catalog = None
+
+    def use_catalog(self, request):
+        return request.accepted_renderer.format == "json"
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_catalog(request):
+            return super().list(request, *args, **kwargs)
+        return self.catalog.response(request)
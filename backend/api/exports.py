@@ -0,0 +1,167 @@
+import csv
+import logging
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F
+from django.http import FileResponse, StreamingHttpResponse
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFError, TTFont
+from reportlab.pdfgen import canvas
+from rest_framework import renderers
+
+from recipes.models import ShoppingListItem
+
+logger = logging.getLogger(__name__)
+
+FONT_NAME = "FreeSans"
+FONT_FILE = (settings.BASE_DIR).joinpath(r"data/fonts/FreeSans.ttf")
+
+PDF_TOP = 800
+PDF_BOTTOM = 50
+PDF_LINE_HEIGHT = 50
+PDF_FONT_SIZE = 16
+# Объём PDF, после которого документ выгружается из памяти во временный
+# файл.
+PDF_SPOOL_SIZE = 1024 * 1024
+
+
+def register_fonts():
+    "Регистрация шрифтов для PDF; выполняется один раз при старте."
+
+    try:
+        pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_FILE))
+    except (OSError, TTFError) as error:
+        logger.error(
+            "Шрифт %s не зарегистрирован, выгрузка PDF недоступна: %s",
+            FONT_NAME,
+            error,
+        )
+
+
+def get_pdf_font():
+    # Встроенные шрифты PDF не содержат кириллицы: без FreeSans список
+    # покупок получился бы нечитаемым.
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        raise ImproperlyConfigured(
+            f"Шрифт {FONT_NAME} не найден: {FONT_FILE}"
+        )
+    return FONT_NAME
+
+
+def get_purchases(user):
+    "Суммарное количество ингредиентов из корзины пользователя."
+
+    return (
+        ShoppingListItem.objects.filter(user=user)
+        .values(
+            "ingredient__name",
+            "ingredient__measurement_unit",
+            amount=F("total_amount"),
+        )
+        .order_by("ingredient__name", "ingredient__measurement_unit")
+        .iterator()
+    )
+
+
+def format_purchase(item):
+    return (
+        f'{item["ingredient__name"].capitalize()}'
+        f'({item["ingredient__measurement_unit"]}) - '
+        f'{item["amount"]}'
+    )
+
+
+class Echo:
+    "Псевдобуфер для csv.writer: возвращает строку вместо записи."
+
+    def write(self, value):
+        return value
+
+
+def iter_txt(purchases):
+    for item in purchases:
+        yield format_purchase(item) + "\n"
+
+
+def iter_csv(purchases):
+    writer = csv.writer(Echo())
+    yield writer.writerow(("Ингредиент", "Единица измерения", "Количество"))
+    for item in purchases:
+        yield writer.writerow(
+            (
+                item["ingredient__name"],
+                item["ingredient__measurement_unit"],
+                item["amount"],
+            )
+        )
+
+
+def build_pdf(purchases):
+    "PDF со списком покупок во временном файле, начиная с его начала."
+
+    output = SpooledTemporaryFile(max_size=PDF_SPOOL_SIZE)
+    pdf = canvas.Canvas(output)
+    font = get_pdf_font()
+    pdf.setFont(font, PDF_FONT_SIZE)
+    pos_y = PDF_TOP
+    for item in purchases:
+        pos_y -= PDF_LINE_HEIGHT
+        if pos_y < PDF_BOTTOM:
+            pdf.showPage()
+            pdf.setFont(font, PDF_FONT_SIZE)
+            pos_y = PDF_TOP - PDF_LINE_HEIGHT
+        pdf.drawString(100, pos_y, format_purchase(item))
+    pdf.showPage()
+    pdf.save()
+    output.seek(0)
+    return output
+
+
+class ShoppingListRenderer(renderers.BaseRenderer):
+    """Рендерер формата списка покупок для согласования содержимого.
+
+    Файл формирует представление, а ошибки отдаются JSONRenderer.
+    """
+
+    charset = "utf-8"
+
+
+class PDFRenderer(ShoppingListRenderer):
+    media_type = "application/pdf"
+    format = "pdf"
+    charset = None
+
+
+class TextRenderer(ShoppingListRenderer):
+    media_type = "text/plain"
+    format = "txt"
+
+
+class CSVRenderer(ShoppingListRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+
+def shopping_list_response(user, export_format):
+    "Потоковый ответ со списком покупок пользователя в формате export_format."
+
+    purchases = get_purchases(user)
+    filename = f"ShoppingCart.{export_format}"
+    if export_format == PDFRenderer.format:
+        return FileResponse(
+            build_pdf(purchases),
+            as_attachment=True,
+            filename=filename,
+            content_type=PDFRenderer.media_type,
+        )
+    if export_format == CSVRenderer.format:
+        content, content_type = iter_csv(purchases), "text/csv"
+    else:
+        content, content_type = iter_txt(purchases), "text/plain"
+    response = StreamingHttpResponse(
+        content, content_type=f"{content_type}; charset=utf-8"
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,138 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Сколько повторяющихся запросов выводить в журнал медленных запросов.
+TOP_DUPLICATES = 3
+IN_LIST_RE = re.compile(r"\(\s*%s(?:\s*,\s*%s)*\s*\)")
+NUMBER_RE = re.compile(r"\b\d+\b")
+
+
+def fingerprint(sql):
+    "SQL без значений: запросы, отличающиеся только параметрами, совпадают."
+
+    return NUMBER_RE.sub("?", IN_LIST_RE.sub("(...)", sql))
+
+
+def get_view_name(view_func, method):
+    "Имя представления DRF с действием, например RecipeViewSet.favorite."
+
+    cls = getattr(view_func, "cls", None)
+    if cls is None:
+        return getattr(view_func, "__qualname__", repr(view_func))
+    actions = getattr(view_func, "actions", None) or {}
+    action = actions.get(method.lower(), method.lower())
+    return f"{cls.__name__}.{action}"
+
+
+class QueryStats:
+    "Счётчик SQL-запросов запроса: подключается через execute_wrapper."
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.samples = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            key = fingerprint(sql)
+            self.fingerprints[key] += 1
+            self.samples.setdefault(key, sql)
+
+    def duplicates(self):
+        "Повторяющиеся запросы по убыванию числа повторов."
+
+        return [
+            (key, count)
+            for key, count in self.fingerprints.most_common()
+            if count > 1
+        ]
+
+
+class SQLInstrumentationMiddleware:
+    """Счётчики SQL и времени обработки для каждого запроса.
+
+    Добавляет заголовок Server-Timing (время БД, представления и
+    рендеринга) и пишет строку JSON в журнал; запросы дольше
+    SLOW_REQUEST_MS записываются с уровнем WARNING вместе с самыми
+    частыми повторами SQL. Включается настройкой
+    SQL_INSTRUMENTATION_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SQL_INSTRUMENTATION_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        request.view_name = None
+        request.view_finished = None
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(stats))
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+        self.report(request, response, stats, start, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.view_name = get_view_name(view_func, request.method)
+
+    def process_template_response(self, request, response):
+        # Вызывается после представления и до рендеринга ответа DRF.
+        request.view_finished = time.perf_counter()
+        return response
+
+    def report(self, request, response, stats, start, total):
+        render = 0.0
+        if request.view_finished is not None:
+            render = start + total - request.view_finished
+        view = total - render - stats.duration
+        duplicates = stats.duplicates()
+        response["Server-Timing"] = ", ".join(
+            (
+                f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} '
+                'queries"',
+                f"view;dur={view * 1000:.1f}",
+                f"render;dur={render * 1000:.1f}",
+                f'sql-dup;desc="{len(duplicates)}"',
+                f"total;dur={total * 1000:.1f}",
+            )
+        )
+
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "view": request.view_name,
+            "status": response.status_code,
+            "total_ms": round(total * 1000, 1),
+            "db_ms": round(stats.duration * 1000, 1),
+            "render_ms": round(render * 1000, 1),
+            "queries": stats.count,
+            "duplicate_queries": sum(count - 1 for _, count in duplicates),
+        }
+        if total * 1000 < settings.SLOW_REQUEST_MS:
+            logger.info(json.dumps(record, ensure_ascii=False))
+            return
+        record["top_duplicates"] = [
+            {"count": count, "sql": stats.samples[key]}
+            for key, count in duplicates[:TOP_DUPLICATES]
+        ]
+        logger.warning(json.dumps(record, ensure_ascii=False))
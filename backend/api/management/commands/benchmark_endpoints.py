@@ -0,0 +1,319 @@
+import gc
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from rest_framework.test import APIClient
+
+from api.cache import bump_generation, recipe_cache
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import User
+
+BUDGETS_FILE = Path(__file__).resolve().parents[2] / "benchmark_budgets.json"
+# Запас при записи бюджетов по результатам текущего прогона.
+LATENCY_HEADROOM = 3
+LATENCY_MIN_HEADROOM_MS = 25
+MEMORY_HEADROOM = 2
+
+
+@dataclass
+class Scenario:
+    "Запросы к одному endpoint, измеряемые вместе."
+
+    name: str
+    requests: list
+    authenticated: bool = True
+    # Сброс кэша ответов перед каждым прогоном: первый запрос после
+    # изменения данных.
+    cold_cache: bool = False
+
+
+class QueryCounter:
+    "Обёртка выполнения SQL, считающая запросы."
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[max(int(round(len(values) * fraction)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Замер времени ответа, числа SQL-запросов и пикового потребления "
+        "памяти основных endpoint с проверкой бюджетов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument(
+            "--user",
+            help="Имя пользователя для запросов; по умолчанию автор "
+            "с наибольшим числом подписок.",
+        )
+        parser.add_argument(
+            "--budgets",
+            default=BUDGETS_FILE,
+            help="Файл бюджетов JSON.",
+        )
+        parser.add_argument(
+            "--output",
+            default="benchmark_results.json",
+            help="Файл для сохранения результатов.",
+        )
+        parser.add_argument(
+            "--write-budgets",
+            action="store_true",
+            help="Записать бюджеты по результатам прогона.",
+        )
+
+    def get_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+        else:
+            user = (
+                User.objects.annotate(subscriptions=Count("subscriber"))
+                .order_by("-subscriptions", "id")
+                .first()
+            )
+        if user is None:
+            raise CommandError(
+                "Нет пользователей: заполните базу командой generate_dataset"
+            )
+        return user
+
+    def get_scenarios(self, user):
+        recipe = Recipe.objects.order_by("-pub_date", "-id").first()
+        tag = Tag.objects.order_by("id").first()
+        ingredient = Ingredient.objects.order_by("id").first()
+        if recipe is None or tag is None or ingredient is None:
+            raise CommandError(
+                "Нет рецептов: заполните базу командой generate_dataset"
+            )
+        # Рецепт вне избранного и корзины: переключение возвращает
+        # состояние базы к исходному.
+        toggled = (
+            Recipe.objects.exclude(favorites__user=user)
+            .exclude(shopping_cart__user=user)
+            .order_by("id")
+            .first()
+        )
+        if toggled is None:
+            raise CommandError(
+                f"У пользователя {user.username} все рецепты в избранном "
+                "или корзине: переключать нечего"
+            )
+        recipe_url = f"/api/recipes/{toggled.id}"
+        return [
+            Scenario("recipes", [("get", "/api/recipes/")]),
+            Scenario(
+                "recipes_anonymous",
+                [("get", "/api/recipes/")],
+                authenticated=False,
+            ),
+            Scenario(
+                "recipes_anonymous_cold",
+                [("get", "/api/recipes/")],
+                authenticated=False,
+                cold_cache=True,
+            ),
+            Scenario(
+                "recipes_by_tag", [("get", f"/api/recipes/?tags={tag.slug}")]
+            ),
+            Scenario(
+                "recipes_by_author",
+                [("get", f"/api/recipes/?author={recipe.author_id}")],
+            ),
+            Scenario(
+                "recipes_favorited", [("get", "/api/recipes/?is_favorited=1")]
+            ),
+            Scenario("recipe_detail", [("get", f"/api/recipes/{recipe.id}/")]),
+            Scenario("feed", [("get", "/api/recipes/feed/")]),
+            Scenario(
+                "subscriptions",
+                [("get", "/api/users/subscriptions/?recipes_limit=3")],
+            ),
+            Scenario(
+                "ingredient_search",
+                [("get", f"/api/ingredients/?name={ingredient.name[:2]}")],
+            ),
+            Scenario(
+                "favorite_toggle",
+                [
+                    ("post", f"{recipe_url}/favorite/"),
+                    ("delete", f"{recipe_url}/favorite/"),
+                ],
+            ),
+            Scenario(
+                "shopping_cart_toggle",
+                [
+                    ("post", f"{recipe_url}/shopping_cart/"),
+                    ("delete", f"{recipe_url}/shopping_cart/"),
+                ],
+            ),
+            Scenario(
+                "download_shopping_cart",
+                [("get", "/api/recipes/download_shopping_cart/?format=txt")],
+            ),
+        ]
+
+    def run_scenario(self, client, scenario):
+        "Выполнение запросов сценария с чтением тела ответа целиком."
+
+        if scenario.cold_cache:
+            bump_generation(recipe_cache.namespace, recipe_cache.alias)
+        for method, url in scenario.requests:
+            response = getattr(client, method)(url)
+            if response.status_code >= 400:
+                raise CommandError(
+                    f"{scenario.name}: {method.upper()} {url} вернул "
+                    f"{response.status_code}"
+                )
+            if response.streaming:
+                b"".join(response.streaming_content)
+            response.close()
+
+    def measure(self, client, scenario, repeat):
+        # Первый прогон прогревает кэши и не входит в замер.
+        self.run_scenario(client, scenario)
+        # CaptureQueriesContext не подходит: тестовый клиент сбрасывает
+        # журнал запросов в начале каждого запроса.
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            self.run_scenario(client, scenario)
+        timings = []
+        # Как в timeit: сборщик мусора не вносит случайные паузы в замер.
+        gc.collect()
+        gc.disable()
+        try:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                self.run_scenario(client, scenario)
+                timings.append((time.perf_counter() - start) * 1000)
+        finally:
+            gc.enable()
+        tracemalloc.start()
+        try:
+            self.run_scenario(client, scenario)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return {
+            "queries": queries.count,
+            "p50_ms": round(statistics.median(timings), 3),
+            "p95_ms": round(percentile(timings, 0.95), 3),
+            "peak_kb": round(peak / 1024, 1),
+        }
+
+    def check_budget(self, name, result, budget):
+        "Список нарушений бюджета сценария."
+
+        violations = []
+        for metric in ("queries", "p95_ms", "peak_kb"):
+            if metric in budget and result[metric] > budget[metric]:
+                violations.append(
+                    f"{name}: {metric} {result[metric]} > {budget[metric]}"
+                )
+        return violations
+
+    def make_budget(self, result):
+        return {
+            "queries": result["queries"],
+            "p95_ms": round(
+                max(
+                    result["p95_ms"] * LATENCY_HEADROOM,
+                    result["p95_ms"] + LATENCY_MIN_HEADROOM_MS,
+                ),
+                1,
+            ),
+            "peak_kb": round(result["peak_kb"] * MEMORY_HEADROOM),
+        }
+
+    def handle(self, *args, **options):
+        user = self.get_user(options["user"])
+        client = APIClient()
+        client.force_authenticate(user)
+        anonymous = APIClient()
+
+        budgets_file = Path(options["budgets"])
+        budgets = {}
+        if budgets_file.is_file():
+            budgets = json.loads(budgets_file.read_text(encoding="utf-8"))
+
+        results = {}
+        violations = []
+        for scenario in self.get_scenarios(user):
+            result = self.measure(
+                client if scenario.authenticated else anonymous,
+                scenario,
+                options["repeat"],
+            )
+            results[scenario.name] = result
+            self.stdout.write(
+                f"{scenario.name:24} запросов {result['queries']:3}  "
+                f"p50 {result['p50_ms']:8.2f} мс  "
+                f"p95 {result['p95_ms']:8.2f} мс  "
+                f"память {result['peak_kb']:9.1f} КБ"
+            )
+            violations.extend(
+                self.check_budget(
+                    scenario.name, result, budgets.get(scenario.name, {})
+                )
+            )
+
+        Path(options["output"]).write_text(
+            json.dumps(
+                {
+                    "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                    "database": connection.vendor,
+                    "python": platform.python_version(),
+                    "user": user.username,
+                    "repeat": options["repeat"],
+                    "cache_enabled": settings.RECIPES_CACHE_ENABLED,
+                    "counts": {
+                        "recipes": Recipe.objects.count(),
+                        "favorites": Favorite.objects.count(),
+                        "shopping_cart": ShoppingCart.objects.count(),
+                    },
+                    "results": results,
+                },
+                ensure_ascii=False,
+                indent=2,
+            ),
+            encoding="utf-8",
+        )
+        self.stdout.write(f"Результаты сохранены в {options['output']}")
+
+        if options["write_budgets"]:
+            budgets_file.write_text(
+                json.dumps(
+                    {
+                        name: self.make_budget(result)
+                        for name, result in results.items()
+                    },
+                    indent=2,
+                )
+                + "\n",
+                encoding="utf-8",
+            )
+            self.stdout.write(f"Бюджеты записаны в {budgets_file}")
+            return
+        if violations:
+            raise CommandError(
+                "Превышены бюджеты:\n" + "\n".join(violations)
+            )
+        self.stdout.write(self.style.SUCCESS("Бюджеты соблюдены"))
@@ -0,0 +1,67 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+import api.serializers as serializers
+from api.search import ingredient_index
+from recipes.models import Ingredient
+
+# Размер подсказки автодополнения с поиском по вхождению.
+AUTOCOMPLETE_LIMIT = 10
+
+
+class Command(BaseCommand):
+    help = "Сравнение поиска ингредиентов через ORM и индекс в памяти."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "queries",
+            nargs="*",
+            help="Строки поиска; по умолчанию первые буквы названий.",
+        )
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def orm_search(self, query):
+        queryset = Ingredient.objects.filter(name__istartswith=query)
+        return serializers.IngredientSerializer(queryset, many=True).data
+
+    def measure(self, search, queries, repeat):
+        timings = []
+        for _ in range(repeat):
+            for query in queries:
+                start = time.perf_counter()
+                search(query)
+                timings.append((time.perf_counter() - start) * 1e6)
+        timings.sort()
+        return (
+            statistics.mean(timings),
+            timings[int(len(timings) * 0.95) - 1],
+        )
+
+    def handle(self, *args, **options):
+        queries = options["queries"] or sorted(
+            {
+                name[:1]
+                for name in Ingredient.objects.values_list("name", flat=True)
+            }
+        )
+        if not queries:
+            self.stderr.write("Нет ингредиентов для поиска")
+            return
+        # Первое обращение строит индекс и не входит в замер.
+        ingredient_index.refresh()
+        for label, search in (
+            ("ORM", self.orm_search),
+            ("Индекс", ingredient_index.search),
+            (
+                f"Индекс, limit={AUTOCOMPLETE_LIMIT}",
+                lambda query: ingredient_index.search(
+                    query, AUTOCOMPLETE_LIMIT
+                ),
+            ),
+        ):
+            mean, p95 = self.measure(search, queries, options["repeat"])
+            self.stdout.write(
+                f"{label}: среднее {mean:.1f} мкс, p95 {p95:.1f} мкс"
+            )
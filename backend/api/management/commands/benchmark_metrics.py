@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+
+from api.metrics import MetricsMiddleware, MetricsRegistry
+
+
+class Command(BaseCommand):
+    help = "Замер накладных расходов записи метрик на один запрос."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=100000)
+
+    def measure(self, handler, request, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            handler(request)
+        return (time.perf_counter() - start) / repeat * 1e6
+
+    def handle(self, *args, **options):
+        response = HttpResponse(b"{}", content_type="application/json")
+        request = RequestFactory().get("/api/recipes/")
+
+        def view(request):
+            return response
+
+        with override_settings(METRICS_ENABLED=True):
+            middleware = MetricsMiddleware(view)
+        # Отдельный реестр, чтобы замер не попал в метрики процесса.
+        middleware.registry = MetricsRegistry()
+        middleware.registry.flush = lambda: None
+        repeat = options["repeat"]
+        baseline = self.measure(view, request, repeat)
+        measured = self.measure(middleware, request, repeat)
+        self.stdout.write(
+            f"Без метрик: {baseline:.2f} мкс, с метриками: "
+            f"{measured:.2f} мкс, накладные расходы: "
+            f"{measured - baseline:.2f} мкс на запрос"
+        )
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.cache import recipe_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Статистика кэша ответов для анонимных пользователей по метрикам "
+        "всех процессов (METRICS_DIR)."
+    )
+
+    def handle(self, *args, **options):
+        if not settings.METRICS_ENABLED:
+            raise CommandError(
+                "Попадания и промахи учитываются только при METRICS_ENABLED"
+            )
+        stats = recipe_cache.stats()
+        self.stdout.write(
+            f"Попадания: {stats['hits']}\n"
+            f"Промахи: {stats['misses']}\n"
+            f"Доля попаданий: {stats['hit_ratio']:.2%}\n"
+            f"Поколение: {stats['generation']}"
+        )
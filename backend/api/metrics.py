@@ -0,0 +1,241 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from api.instrumentation import get_view_name
+
+# Границы корзин гистограммы времени ответа, в секундах.
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+# Значения представления: счётчики корзин (последняя — +Inf), затем
+# суммы времени ответа, времени БД и объёма ответов.
+SUM = len(LATENCY_BUCKETS) + 1
+DB_SUM = SUM + 1
+SIZE_SUM = SUM + 2
+UNRESOLVED_VIEW = "unresolved"
+
+_local = threading.local()
+
+
+def time_query(execute, sql, params, many, context):
+    "Обёртка SQL: накапливает время БД текущего потока."
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        _local.db_time = (
+            getattr(_local, "db_time", 0.0) + time.perf_counter() - start
+        )
+
+
+def install_query_timer(connection, **kwargs):
+    "Подключение time_query к соединению с БД на всё время его жизни."
+
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class MetricsRegistry:
+    """Метрики запросов процесса с общим хранилищем в файлах.
+
+    Каждый процесс накапливает значения в памяти и не чаще раза в
+    METRICS_FLUSH_INTERVAL секунд записывает их целиком в собственный
+    файл каталога METRICS_DIR. Экспорт суммирует файлы всех процессов.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.statuses = Counter()
+        # Попадания и промахи кэшей ответов: (кэш, результат).
+        self.cache_results = Counter()
+        self.flushed_at = time.monotonic()
+
+    @property
+    def directory(self):
+        return Path(settings.METRICS_DIR)
+
+    def observe(self, view, method, status, duration, db_time, size):
+        key = (view, method)
+        with self.lock:
+            values = self.views.get(key)
+            if values is None:
+                values = self.views[key] = [0] * (SIZE_SUM + 1)
+            values[bisect_left(LATENCY_BUCKETS, duration)] += 1
+            values[SUM] += duration
+            values[DB_SUM] += db_time
+            values[SIZE_SUM] += size
+            self.statuses[(view, method, status)] += 1
+        self.flush_if_due()
+
+    def count_cache(self, cache, result):
+        with self.lock:
+            self.cache_results[(cache, result)] += 1
+        self.flush_if_due()
+
+    def flush_if_due(self):
+        interval = settings.METRICS_FLUSH_INTERVAL
+        if time.monotonic() - self.flushed_at > interval:
+            self.flush()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "views": [
+                    [*key, values] for key, values in self.views.items()
+                ],
+                "statuses": [
+                    [*key, count] for key, count in self.statuses.items()
+                ],
+                "cache": [
+                    [*key, count]
+                    for key, count in self.cache_results.items()
+                ],
+            }
+
+    def flush(self):
+        "Запись значений процесса в его файл с атомарной заменой."
+
+        self.flushed_at = time.monotonic()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"metrics-{os.getpid()}.json"
+        temporary = path.with_suffix(".tmp")
+        temporary.write_text(json.dumps(self.snapshot()), encoding="utf-8")
+        os.replace(temporary, path)
+
+    def collect(self):
+        "Сумма значений всех процессов."
+
+        self.flush()
+        views = {}
+        statuses = Counter()
+        cache_results = Counter()
+        for path in self.directory.glob("metrics-*.json"):
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                # Файл процесса мог быть заменён во время чтения.
+                continue
+            for view, method, values in data["views"]:
+                total = views.setdefault((view, method), [0] * len(values))
+                for index, value in enumerate(values):
+                    total[index] += value
+            for view, method, status, count in data["statuses"]:
+                statuses[(view, method, status)] += count
+            for cache, result, count in data.get("cache", []):
+                cache_results[(cache, result)] += count
+        return views, statuses, cache_results
+
+    def render(self):
+        "Метрики в текстовом формате Prometheus."
+
+        views, statuses, cache_results = self.collect()
+        lines = [
+            "# HELP foodgram_request_duration_seconds "
+            "Время обработки запроса.",
+            "# TYPE foodgram_request_duration_seconds histogram",
+        ]
+        for (view, method), values in sorted(views.items()):
+            labels = f'view="{view}",method="{method}"'
+            cumulative = 0
+            for bound, count in zip(
+                (*LATENCY_BUCKETS, "+Inf"), values[:SUM]
+            ):
+                cumulative += count
+                lines.append(
+                    "foodgram_request_duration_seconds_bucket"
+                    f'{{{labels},le="{bound}"}} {cumulative}'
+                )
+            lines.append(
+                f"foodgram_request_duration_seconds_sum{{{labels}}} "
+                f"{values[SUM]}"
+            )
+            lines.append(
+                f"foodgram_request_duration_seconds_count{{{labels}}} "
+                f"{cumulative}"
+            )
+        for name, index, help_text in (
+            ("foodgram_db_duration_seconds_total", DB_SUM, "Время SQL."),
+            (
+                "foodgram_response_size_bytes_total",
+                SIZE_SUM,
+                "Объём тел ответов.",
+            ),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (view, method), values in sorted(views.items()):
+                lines.append(
+                    f'{name}{{view="{view}",method="{method}"}} '
+                    f"{values[index]}"
+                )
+        lines.append("# HELP foodgram_responses_total Ответы по статусам.")
+        lines.append("# TYPE foodgram_responses_total counter")
+        for (view, method, status), count in sorted(statuses.items()):
+            lines.append(
+                f'foodgram_responses_total{{view="{view}",'
+                f'method="{method}",status="{status}"}} {count}'
+            )
+        lines.append(
+            "# HELP foodgram_response_cache_total "
+            "Попадания и промахи кэша ответов."
+        )
+        lines.append("# TYPE foodgram_response_cache_total counter")
+        for (cache, result), count in sorted(cache_results.items()):
+            lines.append(
+                f'foodgram_response_cache_total{{cache="{cache}",'
+                f'result="{result}"}} {count}'
+            )
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    "Запись времени, статуса, объёма ответа и времени БД запроса."
+
+    registry = registry
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _local.db_time = 0.0
+        request.metrics_view = UNRESOLVED_VIEW
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - start
+        self.registry.observe(
+            request.metrics_view,
+            request.method,
+            response.status_code,
+            duration,
+            _local.db_time,
+            0 if response.streaming else len(response.content),
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = get_view_name(view_func, request.method)
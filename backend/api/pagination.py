@@ -1,7 +1,182 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+
+from recipes.feed import get_recipe_ids
+
+
+class KeysetPagination(CursorPagination):
+    "Постраничный вывод по ключу сортировки без COUNT(*) и OFFSET."
+
+    page_size_query_param = "limit"
+
+    def get_ordering(self, request, queryset, view):
+        "Сортировка queryset, дополненная первичным ключом для уникальности."
+
+        ordering = list(
+            queryset.query.order_by or queryset.model._meta.ordering
+        )
+        if not {"pk", "-pk", "id", "-id"} & set(ordering):
+            ordering.append("-pk")
+        return tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        # Пустой результат (например, поиск без совпадений) - пустая
+        # страница при любом курсоре: queryset.none() теряет сортировку,
+        # и позиция курсора с ней не совпадает.
+        if queryset.query.is_empty():
+            self.page, self.has_next, self.has_previous = [], False, False
+            return self.page
+        self.ordering = self.get_ordering(request, queryset, view)
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            position, self.reverse = None, False
+        else:
+            position, self.reverse = (
+                self.decode_position(cursor.position),
+                cursor.reverse,
+            )
+
+        # Предыдущая страница выбирается в обратном порядке сортировки
+        # и затем разворачивается.
+        ordering = self.ordering
+        if self.reverse:
+            ordering = tuple(
+                field[1:] if field.startswith("-") else f"-{field}"
+                for field in ordering
+            )
+        results = self.get_results(queryset, ordering, position)
+        has_following = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        if self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = position is not None
+        return self.page
+
+    def get_results(self, queryset, ordering, position):
+        "Не более page_size + 1 объектов после позиции курсора."
+
+        if position is not None:
+            try:
+                queryset = queryset.filter(
+                    self.get_keyset_filter(ordering, position)
+                )
+            except (ValidationError, ValueError, TypeError):
+                raise NotFound(self.invalid_cursor_message)
+        return list(queryset.order_by(*ordering)[: self.page_size + 1])
+
+    def get_keyset_filter(self, ordering, position):
+        "Условие «строка после позиции курсора» для заданной сортировки."
+
+        if len(position) != len(ordering):
+            raise ValueError("Длина курсора не совпадает с сортировкой")
+        keyset_filter = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            keyset_filter |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return keyset_filter
+
+    def decode_cursor(self, request):
+        # Пустой параметр cursor означает первую страницу.
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        return super().decode_cursor(request)
+
+    def encode_position(self, instance):
+        values = []
+        for field in self.ordering:
+            value = getattr(instance, field.lstrip("-"))
+            if hasattr(value, "isoformat"):
+                value = value.isoformat()
+            values.append(value)
+        return json.dumps(values)
+
+    def decode_position(self, position):
+        try:
+            values = json.loads(position)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(
+            Cursor(
+                offset=0,
+                reverse=False,
+                position=self.encode_position(self.page[-1]),
+            )
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(
+            Cursor(
+                offset=0,
+                reverse=True,
+                position=self.encode_position(self.page[0]),
+            )
+        )
+
+
+class FeedPagination(KeysetPagination):
+    "Постраничный вывод ленты подписок по ключу (pub_date, id)."
+
+    def get_ordering(self, request, queryset, view):
+        return ("-pub_date", "-id")
+
+    def get_results(self, queryset, ordering, position):
+        try:
+            if position is not None and len(position) != len(ordering):
+                raise ValueError("Длина курсора не совпадает с сортировкой")
+            recipe_ids = get_recipe_ids(
+                self.request.user.id,
+                self.page_size + 1,
+                position,
+                descending=ordering[0].startswith("-"),
+            )
+        except (ValidationError, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        recipes = queryset.in_bulk(recipe_ids)
+        return [recipes[pk] for pk in recipe_ids if pk in recipes]
 
 
 class LimitPagination(PageNumberPagination):
     "Ограничение на количество элементов на странице."
 
     page_size_query_param = "limit"
+    # Параметр cursor (в том числе пустой) включает постраничный вывод
+    # по ключу сортировки вместо номеров страниц.
+    cursor_query_param = "cursor"
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,115 @@
+import cProfile
+import logging
+import pstats
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from api.instrumentation import get_view_name
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+PROFILE_PARAM = "profile"
+# Сколько функций проекта выводить в заголовке X-Profile-Top.
+TOP_FUNCTIONS = 5
+
+
+def get_staff_user(request):
+    "Администратор из сессии или токена DRF; иначе None."
+
+    user = getattr(request, "user", None)
+    if user is not None and user.is_staff:
+        return user
+    drf_request = Request(request)
+    for authenticator_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        try:
+            result = authenticator_class().authenticate(drf_request)
+        except APIException:
+            return None
+        if result is not None:
+            return result[0] if result[0].is_staff else None
+    return None
+
+
+def top_functions(profile, limit=TOP_FUNCTIONS):
+    "Функции кода проекта с наибольшим суммарным временем."
+
+    base_dir = str(settings.BASE_DIR)
+    # Значения pstats: (вызовы, вызовы без рекурсии, собственное время,
+    # суммарное время, вызывающие функции).
+    entries = sorted(
+        (
+            (values[3], filename, line, name)
+            for (filename, line, name), values in pstats.Stats(
+                profile
+            ).stats.items()
+            if filename.startswith(base_dir) and filename != __file__
+        ),
+        reverse=True,
+    )
+    return [
+        f"{Path(filename).relative_to(base_dir)}:{line}({name})"
+        f";dur={cumulative * 1000:.1f}"
+        for cumulative, filename, line, name in entries[:limit]
+    ]
+
+
+class ProfilingMiddleware:
+    """Профилирование запроса cProfile по требованию администратора.
+
+    Запрос с заголовком X-Profile или параметром ?profile=1 выполняется
+    под профилировщиком; результат сохраняется в PROFILE_DIR в формате
+    pstats, имя файла и самые затратные функции проекта возвращаются в
+    заголовках ответа. Выключен, пока не задан PROFILING_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def is_requested(self, request):
+        return (
+            PROFILE_HEADER in request.META
+            or PROFILE_PARAM in request.GET
+        )
+
+    def __call__(self, request):
+        if not self.is_requested(request) or get_staff_user(request) is None:
+            return self.get_response(request)
+
+        request.profile_view = None
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.disable()
+        duration = time.perf_counter() - start
+
+        view = request.profile_view or "unresolved"
+        directory = Path(settings.PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        now = time.time()
+        path = directory / (
+            f"{view}-{time.strftime('%Y%m%dT%H%M%S', time.localtime(now))}"
+            f".{int(now % 1 * 1000000):06d}.pstats"
+        )
+        profile.dump_stats(path)
+        logger.info("Профиль %s сохранён в %s", request.path, path)
+
+        response["X-Profile-File"] = path.name
+        response["X-Profile-Total"] = f"{duration * 1000:.1f}ms"
+        response["X-Profile-Top"] = ", ".join(top_functions(profile))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, "profile_view"):
+            request.profile_view = get_view_name(view_func, request.method)
@@ -0,0 +1,305 @@
+import re
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, models, transaction
+
+from api.cache import RECIPES_CACHE, bump_generation, get_generation
+from api.catalogs import ingredient_catalog
+from recipes.models import Recipe, RecipeIngredient
+
+WORD_RE = re.compile(r"\w+")
+# Веса полей, как у setweight в PostgreSQL: A - название,
+# B - ингредиенты, C - описание.
+FIELD_WEIGHTS = {"name": 1.0, "ingredients": 0.4, "text": 0.2}
+# Наибольшее число записей журнала изменений, применяемых к индексу
+# рецептов по одной; при большем отставании индекс собирается заново.
+MAX_LOGGED_CHANGES = 1000
+
+
+class IngredientIndex:
+    "Поиск ингредиентов по префиксу и вхождению в памяти процесса."
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.payload = None
+        self.keys = []
+        self.rows = []
+        self.text = ""
+        self.offsets = []
+
+    def refresh(self):
+        "Перестроение индекса при смене версии справочника."
+
+        payload = self.catalog.get()
+        if payload is self.payload:
+            return
+        rows = sorted(
+            payload.data, key=lambda row: (row["name"].casefold(), row["id"])
+        )
+        self.keys = [row["name"].casefold() for row in rows]
+        self.rows = rows
+        # Все названия в одной строке: поиск вхождений выполняется
+        # str.find без обхода списка в Python.
+        self.text = "\n".join(self.keys)
+        self.offsets = []
+        offset = 0
+        for key in self.keys:
+            self.offsets.append(offset)
+            offset += len(key) + 1
+        self.payload = payload
+
+    def search(self, query, limit=None):
+        """Совпадения по префиксу; с limit дополняются совпадениями по
+        вхождению подстроки.
+
+        Без limit результат тот же, что у фильтра name__istartswith.
+        """
+
+        self.refresh()
+        query = query.casefold()
+        if not query:
+            return self.rows[:limit]
+
+        results = []
+        position = bisect_left(self.keys, query)
+        while (
+            position < len(self.keys)
+            and self.keys[position].startswith(query)
+            and (limit is None or len(results) < limit)
+        ):
+            results.append(self.rows[position])
+            position += 1
+        if limit is None or len(results) >= limit:
+            return results
+
+        # Ранжирование вхождений: чем раньше найдена подстрока и чем
+        # короче название, тем выше результат.
+        matches = []
+        found = self.text.find(query)
+        while found != -1:
+            index = bisect_right(self.offsets, found) - 1
+            start = found - self.offsets[index]
+            key = self.keys[index]
+            if start > 0:
+                matches.append((start, len(key), key, index))
+            found = self.text.find(query, self.offsets[index] + len(key) + 1)
+        matches.sort()
+        results.extend(self.rows[match[-1]] for match in matches)
+        return results[:limit]
+
+
+ingredient_index = IngredientIndex(ingredient_catalog)
+
+
+def tokenize(text):
+    return WORD_RE.findall(text.casefold())
+
+
+class RecipeSearchIndex:
+    """Полнотекстовый поиск рецептов в памяти процесса.
+
+    Используется без PostgreSQL; слова запроса ищутся по префиксу, чтобы
+    находить разные формы слова без морфологии. Изменённые рецепты
+    записываются в журнал в кэше рецептов, общем для процессов, и
+    переиндексируются по одному. Полная сборка выполняется при первом
+    поиске, при смене поколения индекса (переименование ингредиента)
+    и при потере записей журнала.
+    """
+
+    def __init__(self, namespace="recipe_search", alias=RECIPES_CACHE):
+        self.namespace = namespace
+        self.alias = alias
+        self.generation = None
+        self.version = 0
+        self.words = []
+        # {слово: {id рецепта: вес}} и {id рецепта: слова рецепта}.
+        self.postings = {}
+        self.documents = {}
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def version_key(self):
+        return f"{self.namespace}:version"
+
+    def change_key(self, version):
+        return f"{self.namespace}:change:{version}"
+
+    def changed(self, recipe_id):
+        "Запись рецепта в журнал изменений после фиксации транзакции."
+
+        if connection.vendor == "postgresql":
+            return
+        transaction.on_commit(lambda: self.log_change(recipe_id))
+
+    def log_change(self, recipe_id):
+        try:
+            version = self.cache.incr(self.version_key)
+        except ValueError:
+            # Журнал потерян: все процессы соберут индекс заново.
+            self.cache.add(self.version_key, 0, timeout=None)
+            bump_generation(self.namespace, self.alias)
+            return
+        self.cache.set(self.change_key(version), recipe_id, timeout=None)
+
+    def invalidate(self):
+        "Полная пересборка индекса во всех процессах."
+
+        if connection.vendor == "postgresql":
+            return
+        transaction.on_commit(
+            lambda: bump_generation(self.namespace, self.alias)
+        )
+
+    def refresh(self):
+        generation = get_generation(self.namespace, self.alias)
+        version = self.cache.get(self.version_key, 0)
+        if generation != self.generation or version < self.version:
+            self.rebuild(generation, version)
+            return
+        if version == self.version:
+            return
+        keys = [
+            self.change_key(number)
+            for number in range(self.version + 1, version + 1)
+        ]
+        changes = (
+            self.cache.get_many(keys)
+            if len(keys) <= MAX_LOGGED_CHANGES
+            else {}
+        )
+        if len(changes) != len(keys):
+            self.rebuild(generation, version)
+            return
+        self.reindex(set(changes.values()))
+        self.version = version
+
+    def rebuild(self, generation, version):
+        # Журнал читается до данных: изменения, записанные во время
+        # сборки, будут применены повторно при следующем поиске.
+        self.words = []
+        self.postings = {}
+        self.documents = {}
+        self.add_documents(Recipe.objects.all())
+        self.generation = generation
+        self.version = version
+
+    def reindex(self, recipe_ids):
+        "Замена записей индекса для рецептов; удалённые исчезают из него."
+
+        for recipe_id in recipe_ids:
+            for word in self.documents.pop(recipe_id, ()):
+                recipes = self.postings[word]
+                del recipes[recipe_id]
+                if not recipes:
+                    del self.postings[word]
+                    del self.words[bisect_left(self.words, word)]
+        self.add_documents(Recipe.objects.filter(pk__in=recipe_ids))
+
+    def add_documents(self, recipes):
+        ingredients = defaultdict(list)
+        for recipe_id, name in (
+            RecipeIngredient.objects.filter(recipe__in=recipes)
+            .values_list("recipe_id", "ingredient__name")
+            .iterator()
+        ):
+            ingredients[recipe_id].append(name)
+        new_words = set()
+        for recipe_id, name, text in recipes.values_list(
+            "id", "name", "text"
+        ).iterator():
+            weights = defaultdict(float)
+            for field, value in (
+                ("name", name),
+                ("ingredients", " ".join(ingredients[recipe_id])),
+                ("text", text),
+            ):
+                for word in tokenize(value):
+                    weights[word] += FIELD_WEIGHTS[field]
+            for word, weight in weights.items():
+                if word not in self.postings:
+                    self.postings[word] = {}
+                    new_words.add(word)
+                self.postings[word][recipe_id] = weight
+            self.documents[recipe_id] = set(weights)
+        if len(new_words) > len(self.words):
+            self.words = sorted(self.postings)
+        else:
+            for word in new_words:
+                insort(self.words, word)
+
+    def match(self, term):
+        "Релевантность рецептов со словами, начинающимися с term."
+
+        scores = defaultdict(float)
+        words = self.words
+        position = bisect_left(words, term)
+        while position < len(words) and words[position].startswith(term):
+            for recipe_id, weight in self.postings[words[position]].items():
+                scores[recipe_id] += weight
+            position += 1
+        return scores
+
+    def search(self, text):
+        "Пары (id рецепта, релевантность) по убыванию релевантности."
+
+        self.refresh()
+        scores = None
+        for term in set(tokenize(text)):
+            term_scores = self.match(term)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    recipe_id: score + term_scores[recipe_id]
+                    for recipe_id, score in scores.items()
+                    if recipe_id in term_scores
+                }
+            if not scores:
+                return []
+        if scores is None:
+            return []
+        return sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+
+
+recipe_search_index = RecipeSearchIndex()
+
+
+def search_recipes(queryset, text):
+    "Рецепты queryset, найденные по text, по убыванию search_rank."
+
+    if connection.vendor == "postgresql":
+        return queryset.search(text)
+    # Сначала фильтры queryset, затем ограничение числа результатов:
+    # иначе отфильтрованный поиск мог бы вернуть меньше рецептов.
+    limit = settings.RECIPE_SEARCH_FALLBACK_LIMIT
+    ranked = recipe_search_index.search(text)
+    head = [recipe_id for recipe_id, _ in ranked[:limit]]
+    allowed = set(
+        queryset.filter(pk__in=head).order_by().values_list("pk", flat=True)
+    )
+    if len(allowed) < len(head) < len(ranked):
+        # Фильтры отсекают часть лучших совпадений: остальные
+        # проверяются по всем id queryset одним запросом.
+        allowed = set(queryset.order_by().values_list("pk", flat=True))
+    matches = [item for item in ranked if item[0] in allowed][:limit]
+    if not matches:
+        return queryset.none()
+    return (
+        queryset.filter(pk__in=[recipe_id for recipe_id, _ in matches])
+        .annotate(
+            search_rank=models.Case(
+                *(
+                    models.When(pk=recipe_id, then=models.Value(score))
+                    for recipe_id, score in matches
+                ),
+                output_field=models.FloatField(),
+            )
+        )
+        .order_by("-search_rank", *Recipe._meta.ordering)
+    )
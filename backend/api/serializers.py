@@ -1,27 +1,135 @@
 import base64
+import binascii
+import json
 
 import webcolors
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.storage import default_storage
 from django.db import transaction
 from djoser.serializers import UserCreateSerializer
 from rest_framework import serializers
-from rest_framework.generics import get_object_or_404
 
+from recipes.images import variants_ready
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingListItem, Tag)
 from users.models import Subscription, User
 
 
 class Base64ImageField(serializers.ImageField):
     "Класс для декодирования изображения и сохранения в виде файла."
 
+    # Размер порции base64 кратен 4, чтобы каждая декодировалась отдельно.
+    chunk_size = 64 * 1024
+    # Сигнатуры поддерживаемых форматов и расширения файлов.
+    signatures = (
+        (b"\xff\xd8\xff", "jpg"),
+        (b"\x89PNG\r\n\x1a\n", "png"),
+        (b"GIF87a", "gif"),
+        (b"GIF89a", "gif"),
+        (b"RIFF", "webp"),
+    )
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith("data:image"):
-            format, imgstr = data.split(";base64,")
-            ext = format.split("/")[-1]
-            data = ContentFile(base64.b64decode(imgstr), name="temp." + ext)
+            data = self.decode_data_uri(data)
+        elif getattr(data, "size", 0) > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.fail_too_large()
         return super().to_internal_value(data)
 
+    def fail_too_large(self):
+        raise serializers.ValidationError(
+            "Размер изображения превышает "
+            f"{settings.RECIPE_IMAGE_MAX_SIZE // (1024 * 1024)} МБ"
+        )
+
+    def get_extension(self, head):
+        for signature, extension in self.signatures:
+            if head.startswith(signature):
+                if extension == "webp" and head[8:12] != b"WEBP":
+                    break
+                return extension
+        raise serializers.ValidationError(
+            "Неподдерживаемый формат изображения"
+        )
+
+    def decode_data_uri(self, data):
+        "Декодирование data URI порциями во временный файл на диске."
+
+        # Строка не разрезается целиком: копируются только порции.
+        start = data.find(";base64,")
+        if start == -1:
+            raise serializers.ValidationError("Ожидается изображение в base64")
+        start += len(";base64,")
+        if (len(data) - start) // 4 * 3 > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.fail_too_large()
+
+        image = None
+        size = 0
+        pending = ""
+        try:
+            for offset in range(start, len(data), self.chunk_size):
+                # Переносы строк (base64 в стиле MIME) отбрасываются;
+                # символы сверх кратного 4 числа переходят в следующую
+                # порцию.
+                pending += "".join(
+                    data[offset: offset + self.chunk_size].split()
+                )
+                end = len(pending)
+                if offset + self.chunk_size < len(data):
+                    end -= end % 4
+                chunk = base64.b64decode(pending[:end], validate=True)
+                pending = pending[end:]
+                if not chunk:
+                    continue
+                if image is None:
+                    extension = self.get_extension(chunk[:12])
+                    image = TemporaryUploadedFile(
+                        f"temp.{extension}", f"image/{extension}", 0, None
+                    )
+                size += len(chunk)
+                image.write(chunk)
+        except binascii.Error:
+            if image is not None:
+                image.close()
+            raise serializers.ValidationError("Некорректные данные base64")
+        if image is None:
+            raise serializers.ValidationError("Пустое изображение")
+        image.size = size
+        image.seek(0)
+        return image
+
+
+class ImageSrcsetField(serializers.Field):
+    "Набор уменьшенных копий картинки рецепта в формате srcset."
+
+    def __init__(self, **kwargs):
+        kwargs["source"] = kwargs.get("source", "*")
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def build_url(self, name):
+        url = default_storage.url(name)
+        request = self.context.get("request")
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def to_representation(self, recipe):
+        # Пока копии не построены, отдаётся только оригинал.
+        if not variants_ready(recipe):
+            return {"default": self.build_url(recipe.image.name)}
+        srcset = {}
+        default = None
+        for format_name, paths in recipe.image_variants["formats"].items():
+            widths = sorted(paths, key=int)
+            srcset[format_name] = ", ".join(
+                f"{self.build_url(paths[width])} {width}w" for width in widths
+            )
+            default = self.build_url(paths[widths[-1]])
+        srcset["default"] = default
+        return srcset
+
 
 class Hex2NameColor(serializers.Field):
     "Класс преобразования цвета в HEX в читаемое имя."
@@ -64,13 +172,15 @@ class CustomUserSerializer(serializers.ModelSerializer):
         user = self.context.get("request").user
         if user.is_anonymous:
             return False
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         return Subscription.objects.filter(
             subscriber=user, author=obj.id
         ).exists()
 
     def get_recipes_count(self, obj):
         "Функция подсчёта количества рецептов."
-        return obj.recipes.count()
+        return obj.recipes_count
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -127,7 +237,6 @@ class SubscriptionsRepresentSerializer(serializers.ModelSerializer):
     "Сериализатор для отображения информации в подписке."
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -146,6 +255,10 @@ class SubscriptionsRepresentSerializer(serializers.ModelSerializer):
     def get_recipes(self, obj):
         "Функция ограничения отображаемых рецептов."
 
+        if hasattr(obj, "limited_recipes"):
+            return SubscriptionsRecipesSerializer(
+                obj.limited_recipes, many=True
+            ).data
         limit = self.context.get("recipes_limit")
         queryset = Recipe.objects.filter(author=obj.id)
         if limit is not None:
@@ -156,20 +269,10 @@ class SubscriptionsRepresentSerializer(serializers.ModelSerializer):
             queryset = queryset[:limit]
         return SubscriptionsRecipesSerializer(queryset, many=True).data
 
-    def get_recipes_count(self, obj):
-        "Функция подсчёта количества рецептов."
-
-        return obj.recipes.count()
-
     def get_is_subscribed(self, obj):
-        "Функция проверки подписки."
+        "Сериализатор отображает только авторов из подписок пользователя."
 
-        user = self.context.get("request").user
-        if user.is_anonymous:
-            return False
-        return Subscription.objects.filter(
-            subscriber=user, author=obj.id
-        ).exists()
+        return True
 
 
 #
@@ -214,6 +317,7 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     author = CustomUserSerializer(read_only=True)
     image = Base64ImageField(required=True, allow_null=False)
+    image_srcset = ImageSrcsetField()
     ingredients = RecipeIngredientSerializer(
         many=True, source="recipe_ingredients", read_only=True
     )
@@ -229,6 +333,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             "name",
             "text",
             "image",
+            "image_srcset",
             "ingredients",
             "tags",
             "cooking_time",
@@ -242,6 +347,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         user = self.context.get("request").user
         if user.is_anonymous:
             return False
+        if hasattr(obj, "is_favorited"):
+            return obj.is_favorited
         return Favorite.objects.filter(user=user, recipe=obj.id).exists()
 
     def get_is_in_shopping_cart(self, obj):
@@ -250,8 +357,18 @@ class RecipeSerializer(serializers.ModelSerializer):
         user = self.context.get("request").user
         if user.is_anonymous:
             return False
+        if hasattr(obj, "is_in_shopping_cart"):
+            return obj.is_in_shopping_cart
         return ShoppingCart.objects.filter(user=user, recipe=obj.id).exists()
 
+    def to_representation(self, instance):
+        # Признак подписки на автора аннотирован на рецепте
+        # (см. RecipeQuerySet.with_user_flags) и передаётся автору,
+        # чтобы CustomUserSerializer не выполнял отдельный запрос.
+        if hasattr(instance, "author_subscribed"):
+            instance.author.is_subscribed = instance.author_subscribed
+        return super().to_representation(instance)
+
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     "Сериализатор для создания и обновления рецептов."
@@ -276,62 +393,191 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         )
 
     def validate(self, data):
-        tags = self.initial_data.get("tags")
-        ingredients = self.initial_data.get("ingredients")
-        ids = [ingredient["id"] for ingredient in ingredients]
-        ids_set = set(ids)
-        if len(ids) != len(ids_set):
+        # При частичном обновлении отсутствующие теги и ингредиенты
+        # остаются без изменений. Ошибки тегов и ингредиентов
+        # возвращаются вместе.
+        errors = {}
+        for field_name, validate_items in (
+            ("tags", self.validate_tags_data),
+            ("ingredients", self.validate_ingredients_data),
+        ):
+            if field_name not in self.initial_data:
+                if not self.partial:
+                    errors[field_name] = ["Обязательное поле."]
+                continue
+            try:
+                data[field_name] = validate_items(
+                    self.get_initial_list(field_name)
+                )
+            except serializers.ValidationError as error:
+                errors.update(error.detail)
+        if errors:
+            raise serializers.ValidationError(errors)
+        return data
+
+    def get_initial_list(self, field_name):
+        "Список из JSON или из multipart/form-data."
+
+        if not hasattr(self.initial_data, "getlist"):
+            return self.initial_data[field_name]
+        # В форме теги передаются повторяющимся полем или, как и
+        # ингредиенты, JSON-массивом в одном поле.
+        values = self.initial_data.getlist(field_name)
+        if len(values) == 1 and values[0].lstrip().startswith("["):
+            try:
+                return json.loads(values[0])
+            except ValueError:
+                raise serializers.ValidationError(
+                    {field_name: "Некорректный JSON"}
+                )
+        return values
+
+    def validate_tags_data(self, tags):
+        return list(self.get_objects(Tag, tags, "tags").values())
+
+    def validate_ingredients_data(self, ingredients):
+        # id и количество приводятся к int до проверок: "1" и 1 - один
+        # и тот же ингредиент.
+        try:
+            ingredients = [
+                (int(ingredient["id"]), int(ingredient["amount"]))
+                for ingredient in ingredients
+            ]
+        except (KeyError, TypeError, ValueError):
             raise serializers.ValidationError(
-                "Ингредиенты должны быть уникальны"
+                {
+                    "ingredients": "Ожидается список объектов с целыми "
+                    "id и amount"
+                }
             )
-        amounts = [
-            int(ingredient["amount"])
-            for ingredient in ingredients
-            if int(ingredient["amount"]) <= 0
+        if not ingredients:
+            raise serializers.ValidationError(
+                {"ingredients": "Нужен хотя бы один ингредиент"}
+            )
+        ids = [pk for pk, _ in ingredients]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError(
+                {"ingredients": "Ингредиенты должны быть уникальны"}
+            )
+        if any(amount <= 0 for _, amount in ingredients):
+            raise serializers.ValidationError(
+                {
+                    "ingredients": "Количество ингредиентов должно быть "
+                    "больше нуля"
+                }
+            )
+        ingredient_objects = self.get_objects(Ingredient, ids, "ingredients")
+        return [
+            {"ingredient": ingredient_objects[pk], "amount": amount}
+            for pk, amount in ingredients
         ]
-        if amounts:
+
+    @staticmethod
+    def get_objects(model, ids, field_name):
+        "Получение объектов одним запросом с перечнем отсутствующих id."
+
+        try:
+            ids = [int(pk) for pk in ids]
+        except (TypeError, ValueError):
             raise serializers.ValidationError(
-                "Количество ингредиентов должно быть больше нуля"
+                {field_name: "Идентификаторы должны быть целыми числами"}
             )
-        data["tags"] = tags
-        data["ingredients"] = ingredients
-        return data
+        objects = model.objects.in_bulk(ids)
+        missing = [str(pk) for pk in ids if pk not in objects]
+        if missing:
+            raise serializers.ValidationError(
+                {field_name: f"Объекты не найдены: {', '.join(missing)}"}
+            )
+        return objects
+
+    @staticmethod
+    def create_ingredients(recipe, ingredients):
+        return RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient=ingredient["ingredient"],
+                amount=ingredient["amount"],
+            )
+            for ingredient in ingredients
+        )
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            # Хранилище перемещает временный файл картинки; закрытие здесь
+            # не оставляет его удаление сборщику мусора.
+            image = self.validated_data.get("image")
+            if isinstance(image, TemporaryUploadedFile):
+                image.close()
 
     @transaction.atomic()
     def create(self, validated_data):
-        ingredients_list = []
         tags = validated_data.pop("tags")
         ingredients = validated_data.pop("ingredients")
         recipe = Recipe.objects.create(**validated_data)
-        for tag in tags:
-            recipe.tags.add(get_object_or_404(Tag, pk=tag))
-        for ingr in ingredients:
-            amount = ingr["amount"]
-            current_ingredient = get_object_or_404(Ingredient, pk=ingr["id"])
-            ingredients_list.append(
-                RecipeIngredient(
-                    ingredient=current_ingredient, amount=amount, recipe=recipe
-                )
-            )
-        RecipeIngredient.objects.bulk_create(ingredients_list)
+        through = Recipe.tags.through
+        through.objects.bulk_create(
+            through(recipe=recipe, tag=tag) for tag in tags
+        )
+        self.create_ingredients(recipe, ingredients)
         return recipe
 
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        "Изменение только добавленных, удалённых и изменённых ингредиентов."
+
+        existing = {
+            item.ingredient_id: item
+            for item in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient_id: item.amount
+            for ingredient_id, item in existing.items()
+        }
+        new_amounts = {
+            ingredient["ingredient"].id: ingredient["amount"]
+            for ingredient in ingredients
+        }
+        removed = [
+            item.pk
+            for ingredient_id, item in existing.items()
+            if ingredient_id not in new_amounts
+        ]
+        changed = []
+        added = []
+        for ingredient_id, amount in new_amounts.items():
+            item = existing.get(ingredient_id)
+            if item is None:
+                added.append(
+                    RecipeIngredient(
+                        recipe=recipe,
+                        ingredient_id=ingredient_id,
+                        amount=amount,
+                    )
+                )
+            elif item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        if removed:
+            RecipeIngredient.objects.filter(pk__in=removed).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ["amount"])
+        if added:
+            RecipeIngredient.objects.bulk_create(added)
+        ShoppingListItem.objects.apply_recipe_change(
+            recipe.id, old_amounts, new_amounts
+        )
+
     @transaction.atomic()
     def update(self, instance, validated_data):
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        ingredients_list = []
-        ingredients = validated_data.pop("ingredients")
-        for ingr in ingredients:
-            amount = ingr["amount"]
-            current_ingredient = get_object_or_404(Ingredient, pk=ingr["id"])
-            ingredients_list.append(
-                RecipeIngredient(
-                    ingredient=current_ingredient,
-                    amount=amount,
-                    recipe=instance,
-                )
-            )
-        RecipeIngredient.objects.bulk_create(ingredients_list)
+        ingredients = validated_data.pop("ingredients", None)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
+        tags = validated_data.pop("tags", None)
+        if tags is not None:
+            # RelatedManager.set() удаляет и добавляет только разницу.
+            instance.tags.set(tags)
         return super().update(instance, validated_data)
 
     def get_is_favorited(self, obj):
@@ -348,16 +594,28 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation["ingredients"] = self.initial_data["ingredients"]
+        if "ingredients" in self.initial_data:
+            # Проверенные значения, а не исходные: id из формы - строки.
+            representation["ingredients"] = [
+                {"id": item["ingredient"].id, "amount": item["amount"]}
+                for item in self.validated_data["ingredients"]
+            ]
+        else:
+            representation["ingredients"] = [
+                {"id": item.ingredient_id, "amount": item.amount}
+                for item in instance.recipe_ingredients.all()
+            ]
         return representation
 
 
 class SubscriptionsRecipesSerializer(serializers.ModelSerializer):
     "Сериализатор для отображения рецептов в подписке."
 
+    image_srcset = ImageSrcsetField()
+
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "image_srcset", "cooking_time")
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -370,10 +628,18 @@ class FavoriteSerializer(serializers.ModelSerializer):
         read_only=True, source="recipe.cooking_time"
     )
     image = serializers.ImageField(read_only=True, source="recipe.image")
+    image_srcset = ImageSrcsetField(source="recipe")
 
     class Meta:
         model = Favorite
-        fields = ("recipe", "user", "name", "cooking_time", "image")
+        fields = (
+            "recipe",
+            "user",
+            "name",
+            "cooking_time",
+            "image",
+            "image_srcset",
+        )
 
     def validate(self, data):
         user = data["user"]
@@ -395,10 +661,18 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         read_only=True, source="recipe.cooking_time"
     )
     image = serializers.ImageField(read_only=True, source="recipe.image")
+    image_srcset = ImageSrcsetField(source="recipe")
 
     class Meta:
         model = ShoppingCart
-        fields = ("recipe", "user", "name", "cooking_time", "image")
+        fields = (
+            "recipe",
+            "user",
+            "name",
+            "cooking_time",
+            "image",
+            "image_srcset",
+        )
 
     def validate(self, data):
         user = data["user"]
@@ -408,3 +682,17 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
                 "Вы уже добавили этот рецепт в корзину"
             )
         return data
+
+
+class RecipeBatchSerializer(serializers.Serializer):
+    "Список id рецептов для пакетного добавления или удаления."
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPE_BATCH_MAX_SIZE,
+    )
+
+    def validate_recipes(self, value):
+        # Повторы убираются с сохранением порядка.
+        return list(dict.fromkeys(value))
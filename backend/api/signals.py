@@ -0,0 +1,67 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from api.cache import recipe_cache
+from api.catalogs import ingredient_catalog, tag_catalog
+from api.search import recipe_search_index
+from recipes.images import variants_saved
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.signals import catalog_imported
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(variants_saved, sender=Recipe)
+def invalidate_recipe_cache(**kwargs):
+    "Сброс кэша рецептов при изменении данных, попадающих в ответ."
+
+    recipe_cache.invalidate()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def reindex_recipe(instance, **kwargs):
+    "Переиндексация рецепта в поиске без PostgreSQL."
+
+    recipe_search_index.changed(instance.pk)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def reindex_recipe_ingredients(instance, **kwargs):
+    "Переиндексация рецепта после изменения его ингредиентов."
+
+    recipe_search_index.changed(instance.recipe_id)
+
+
+@receiver(post_save, sender=Ingredient)
+def rebuild_recipe_search_index(created, **kwargs):
+    "Пересборка поиска после переименования ингредиента."
+
+    if not created:
+        recipe_search_index.invalidate()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(catalog_imported, sender=Tag)
+def invalidate_tag_catalog(**kwargs):
+    "Пересборка справочника тегов."
+
+    tag_catalog.invalidate()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(catalog_imported, sender=Ingredient)
+def invalidate_ingredient_catalog(**kwargs):
+    "Пересборка справочника ингредиентов."
+
+    ingredient_catalog.invalidate()
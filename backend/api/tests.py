@@ -0,0 +1,732 @@
+import base64
+import io
+import json
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from rest_framework.test import APIClient
+
+from api.cache import bump_generation, get_generation, recipe_cache
+from api.catalogs import ingredient_catalog, tag_catalog
+from api.exports import FONT_NAME, get_pdf_font
+from api.search import recipe_search_index
+from api.serializers import Base64ImageField
+from recipes.images import generate_variants
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingListItem, Tag)
+from users.models import Subscription, User
+
+RECIPES = 35
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def create_user(username):
+    return User.objects.create(
+        username=username,
+        email=f"{username}@example.com",
+        first_name=username,
+        last_name=username,
+    )
+
+
+def create_recipe(author, name, tags, ingredients):
+    "Рецепт с тегами и ингредиентами {ингредиент: количество}."
+
+    recipe = Recipe.objects.create(
+        author=author,
+        name=name,
+        text=name,
+        image="recipes/images/test.png",
+        cooking_time=5,
+    )
+    recipe.tags.set(tags)
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=amount)
+        for ingredient, amount in ingredients.items()
+    )
+    return recipe
+
+
+def create_png():
+    output = io.BytesIO()
+    Image.new("RGB", (2, 2)).save(output, "PNG")
+    return output.getvalue()
+
+
+@override_settings(RECIPES_CACHE_ENABLED=False, IMAGE_VARIANTS_ENABLED=False)
+class APITestCase(TestCase):
+    "Данные для тестов API: авторы, теги, ингредиенты и рецепты."
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("reader")
+        cls.authors = [create_user(f"author{i}") for i in range(3)]
+        cls.tags = [
+            Tag.objects.create(name=f"Тег {i}", color="#FF0000", slug=f"t{i}")
+            for i in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f"Ингредиент {i}", measurement_unit="г"
+            )
+            for i in range(3)
+        ]
+        cls.recipes = [
+            create_recipe(
+                cls.authors[i % len(cls.authors)],
+                f"Рецепт {i}",
+                cls.tags[: i % 2 + 1],
+                {cls.ingredients[0]: 10, cls.ingredients[1 + i % 2]: 5},
+            )
+            for i in range(RECIPES)
+        ]
+
+    def setUp(self):
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class RecipeListTests(APITestCase):
+    "Число запросов списка рецептов не зависит от размера страницы."
+
+    # COUNT, рецепты с автором и отметками, теги, ингредиенты.
+    QUERIES = 4
+
+    def assert_page_queries(self, client):
+        for limit in (6, 30):
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(self.QUERIES):
+                    response = client.get(f"/api/recipes/?limit={limit}")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()["results"]), limit)
+
+    def test_anonymous_queries(self):
+        self.assert_page_queries(self.anonymous)
+
+    def test_authenticated_queries(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipes[-1])
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[-1])
+        Subscription.objects.create(
+            subscriber=self.user, author=self.recipes[-1].author
+        )
+        self.assert_page_queries(self.client)
+        first = self.client.get("/api/recipes/?limit=1").json()["results"][0]
+        self.assertEqual(first["id"], self.recipes[-1].id)
+        self.assertTrue(first["is_favorited"])
+        self.assertTrue(first["is_in_shopping_cart"])
+        self.assertTrue(first["author"]["is_subscribed"])
+
+
+class RelationToggleTests(APITestCase):
+    "Добавление и удаление рецепта в избранном и корзине."
+
+    def test_favorite(self):
+        recipe = self.recipes[0]
+        url = f"/api/recipes/{recipe.id}/favorite/"
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+
+    def test_shopping_cart(self):
+        first, second = self.recipes[0], self.recipes[1]
+        for recipe in (first, second):
+            response = self.client.post(
+                f"/api/recipes/{recipe.id}/shopping_cart/"
+            )
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            dict(
+                self.user.shopping_list.values_list(
+                    "ingredient_id", "total_amount"
+                )
+            ),
+            {
+                self.ingredients[0].id: 20,
+                self.ingredients[1].id: 5,
+                self.ingredients[2].id: 5,
+            },
+        )
+        response = self.client.delete(
+            f"/api/recipes/{first.id}/shopping_cart/"
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(
+            dict(
+                self.user.shopping_list.values_list(
+                    "ingredient_id", "total_amount"
+                )
+            ),
+            {self.ingredients[0].id: 10, self.ingredients[2].id: 5},
+        )
+        second.refresh_from_db()
+        self.assertEqual(second.cart_count, 1)
+
+    def test_missing_recipe(self):
+        response = self.client.post("/api/recipes/0/favorite/")
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+
+class FeedTests(APITestCase):
+    "Лента подписок: рассылка, отписка и переход автора через порог."
+
+    def get_feed(self, client, limit=10):
+        response = client.get(f"/api/recipes/feed/?limit={limit}")
+        self.assertEqual(response.status_code, 200)
+        return [recipe["id"] for recipe in response.json()["results"]]
+
+    def expected(self, author, limit=10):
+        return list(
+            Recipe.objects.filter(author=author)
+            .order_by("-pub_date", "-id")
+            .values_list("id", flat=True)[:limit]
+        )
+
+    def subscribe(self, client, author, method="post"):
+        response = getattr(client, method)(
+            f"/api/users/{author.id}/subscribe/"
+        )
+        self.assertIn(response.status_code, (201, 204))
+
+    def test_subscribe_and_unsubscribe(self):
+        author = self.authors[0]
+        self.subscribe(self.client, author)
+        self.assertEqual(self.get_feed(self.client), self.expected(author))
+        self.subscribe(self.client, author, "delete")
+        self.assertEqual(self.get_feed(self.client), [])
+
+    def test_queries_do_not_depend_on_limit(self):
+        for author in self.authors:
+            self.subscribe(self.client, author)
+        for limit in (6, 30):
+            with self.subTest(limit=limit):
+                # Записи ленты, рецепты популярных авторов, рецепты,
+                # теги, ингредиенты.
+                with self.assertNumQueries(5):
+                    ids = self.get_feed(self.client, limit)
+                self.assertEqual(len(ids), limit)
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_author_drops_to_fanout_limit(self):
+        author = self.authors[0]
+        other = APIClient()
+        other.force_authenticate(create_user("other"))
+        self.subscribe(self.client, author)
+        self.subscribe(other, author)
+        # Подписчиков больше порога: рецепты читаются напрямую.
+        self.assertEqual(self.get_feed(self.client), self.expected(author))
+        self.subscribe(other, author, "delete")
+        # Рецепты разосланы оставшемуся подписчику.
+        self.assertEqual(
+            self.user.feed.count(),
+            Recipe.objects.filter(author=author).count(),
+        )
+        self.assertEqual(self.get_feed(self.client), self.expected(author))
+
+
+class SubscriptionsTests(APITestCase):
+    "Список подписок с ограничением числа рецептов автора."
+
+    url = "/api/users/subscriptions/"
+
+    def test_empty_with_recipes_limit(self):
+        response = self.client.get(f"{self.url}?recipes_limit=2")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], [])
+
+    def test_recipes_limit(self):
+        for author in self.authors:
+            Subscription.objects.create(subscriber=self.user, author=author)
+        response = self.client.get(f"{self.url}?recipes_limit=2")
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(len(results), len(self.authors))
+        for author in results:
+            expected = list(
+                Recipe.objects.filter(author_id=author["id"])
+                .order_by("-pub_date", "-id")
+                .values_list("id", flat=True)[:2]
+            )
+            self.assertEqual(
+                [recipe["id"] for recipe in author["recipes"]], expected
+            )
+
+    def test_non_positive_recipes_limit(self):
+        for value in ("0", "-1"):
+            with self.subTest(recipes_limit=value):
+                response = self.client.get(
+                    f"{self.url}?recipes_limit={value}"
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("recipes_limit", response.json())
+
+
+class RecipeSearchTests(APITestCase):
+    "Поиск рецептов без PostgreSQL: курсор, фильтры и обновление индекса."
+
+    def setUp(self):
+        super().setUp()
+        # Индекс живёт в памяти процесса, а данные других тестов
+        # откатываются: он собирается заново.
+        recipe_search_index.generation = None
+
+    def search_ids(self, **params):
+        response = self.client.get("/api/recipes/", params)
+        self.assertEqual(response.status_code, 200)
+        return [recipe["id"] for recipe in response.json()["results"]]
+
+    def test_cursor_over_equal_ranks(self):
+        ids = []
+        url = "/api/recipes/"
+        params = {"search": "рецепт", "cursor": "", "limit": 4}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            ids.extend(recipe["id"] for recipe in page["results"])
+            url, params = page["next"], None
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(set(ids), {recipe.id for recipe in self.recipes})
+
+    @override_settings(RECIPE_SEARCH_FALLBACK_LIMIT=5)
+    def test_filters_apply_before_limit(self):
+        author = self.authors[0]
+        ids = self.search_ids(
+            search="рецепт", author=author.id, limit=10
+        )
+        self.assertEqual(len(ids), 5)
+        self.assertTrue(
+            set(ids) <= set(author.recipes.values_list("id", flat=True))
+        )
+
+    def test_index_follows_recipe_changes(self):
+        recipe = self.recipes[0]
+        self.assertEqual(self.search_ids(search="борщ"), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.name = "Борщ"
+            recipe.save()
+        self.assertEqual(self.search_ids(search="борщ"), [recipe.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            created = create_recipe(
+                self.authors[1], "Борщ зелёный", self.tags, {}
+            )
+        self.assertEqual(
+            set(self.search_ids(search="борщ")), {recipe.id, created.id}
+        )
+        self.assertEqual(self.search_ids(search="зелён"), [created.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            created.delete()
+        self.assertEqual(self.search_ids(search="борщ"), [recipe.id])
+        self.assertEqual(self.search_ids(search="зелён"), [])
+
+
+class ShoppingListExportTests(APITestCase):
+    "Выгрузка списка покупок в pdf, txt и csv и ошибки выгрузки."
+
+    url = "/api/recipes/download_shopping_cart/"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Шрифты лежат в data/ в корне репозитория, а в контейнере
+        # монтируются рядом с приложением.
+        if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(
+                    FONT_NAME,
+                    settings.BASE_DIR.parent / "data/fonts/FreeSans.ttf",
+                )
+            )
+
+    def setUp(self):
+        super().setUp()
+        for recipe in self.recipes[:2]:
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+
+    def download(self, export_format):
+        response = self.client.get(self.url, {"format": export_format})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["Content-Disposition"],
+            f'attachment; filename="ShoppingCart.{export_format}"',
+        )
+        return b"".join(response.streaming_content)
+
+    def test_txt(self):
+        self.assertEqual(
+            self.download("txt").decode(),
+            "Ингредиент 0(г) - 20\n"
+            "Ингредиент 1(г) - 5\n"
+            "Ингредиент 2(г) - 5\n",
+        )
+
+    def test_csv(self):
+        self.assertEqual(
+            self.download("csv").decode().splitlines(),
+            [
+                "Ингредиент,Единица измерения,Количество",
+                "Ингредиент 0,г,20",
+                "Ингредиент 1,г,5",
+                "Ингредиент 2,г,5",
+            ],
+        )
+
+    def test_pdf(self):
+        self.assertTrue(self.download("pdf").startswith(b"%PDF"))
+
+    def test_pdf_without_font(self):
+        with mock.patch.object(
+            pdfmetrics, "getRegisteredFontNames", return_value=[]
+        ):
+            with self.assertRaises(ImproperlyConfigured):
+                get_pdf_font()
+
+    def test_errors_are_json(self):
+        for client, headers, status in (
+            (self.anonymous, {}, 401),
+            (self.client, {"HTTP_ACCEPT": "application/xml"}, 406),
+        ):
+            with self.subTest(status=status):
+                response = client.get(self.url, **headers)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(response["Content-Type"], "application/json")
+                self.assertIn("detail", response.json())
+
+
+class CatalogTests(APITestCase):
+    "Справочник тегов: ETag и фильтр рецептов по slug."
+
+    def setUp(self):
+        super().setUp()
+        # Справочник живёт в памяти процесса и мог остаться от других
+        # тестов.
+        tag_catalog.bump()
+
+    def filter_ids(self, *slugs):
+        response = self.client.get(
+            "/api/recipes/", {"tags": slugs, "limit": RECIPES}
+        )
+        self.assertEqual(response.status_code, 200)
+        return {recipe["id"] for recipe in response.json()["results"]}
+
+    def test_etag(self):
+        response = self.anonymous.get("/api/tags/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), len(self.tags))
+        response = self.anonymous.get(
+            "/api/tags/", HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_tag_filter(self):
+        self.assertEqual(
+            self.filter_ids("t1"),
+            {recipe.id for recipe in self.recipes[1::2]},
+        )
+        self.assertEqual(self.filter_ids("unknown"), set())
+
+    def test_tag_missing_from_catalog(self):
+        tag_catalog.get()
+        # on_commit в тесте не выполняется: справочник не знает о теге,
+        # как процесс без общего кэша.
+        tag = Tag.objects.create(name="Новый", color="#00FF00", slug="new")
+        self.recipes[0].tags.add(tag)
+        self.assertNotIn("new", tag_catalog.get_index("slug"))
+        self.assertEqual(self.filter_ids("new"), {self.recipes[0].id})
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeWriteTests(APITestCase):
+    "Создание и изменение рецептов."
+
+    url = "/api/recipes/"
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def recipe_data(self, **fields):
+        image = base64.b64encode(create_png()).decode()
+        data = {
+            "name": "Борщ",
+            "text": "Борщ",
+            "cooking_time": 60,
+            "image": f"data:image/png;base64,{image}",
+            "tags": [self.tags[0].id],
+            "ingredients": [{"id": self.ingredients[0].id, "amount": 100}],
+        }
+        data.update(fields)
+        return data
+
+    def test_missing_tags_and_ingredients(self):
+        response = self.client.post(
+            self.url,
+            self.recipe_data(
+                tags=[self.tags[0].id, 0],
+                ingredients=[{"id": 0, "amount": 1}],
+            ),
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {"tags", "ingredients"})
+        self.assertFalse(Recipe.objects.filter(name="Борщ").exists())
+
+    def test_create_returns_normalized_values(self):
+        ingredient = self.ingredients[1]
+        response = self.client.post(
+            self.url,
+            self.recipe_data(
+                tags=[str(self.tags[1].id)],
+                ingredients=[{"id": str(ingredient.id), "amount": "50"}],
+            ),
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data["tags"], [self.tags[1].id])
+        self.assertEqual(
+            data["ingredients"], [{"id": ingredient.id, "amount": 50}]
+        )
+
+    def test_empty_ingredients(self):
+        response = self.client.post(
+            self.url, self.recipe_data(ingredients=[]), format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("ingredients", response.json())
+
+    def test_base64_with_line_breaks(self):
+        image = base64.encodebytes(create_png() * 4).decode()
+        self.assertIn("\n", image)
+        # Маленькие порции проверяют перенос остатка между ними.
+        with mock.patch.object(Base64ImageField, "chunk_size", 16):
+            response = self.client.post(
+                self.url,
+                self.recipe_data(image=f"data:image/png;base64,{image}"),
+                format="json",
+            )
+        self.assertEqual(response.status_code, 201)
+        recipe = Recipe.objects.get(name="Борщ")
+        with recipe.image.open("rb") as image_file:
+            self.assertEqual(image_file.read(), create_png() * 4)
+
+    def test_multipart_upload(self):
+        ingredient = self.ingredients[2]
+        data = self.recipe_data(
+            image=SimpleUploadedFile("recipe.png", create_png(), "image/png"),
+            tags=[self.tags[0].id, self.tags[1].id],
+            ingredients=json.dumps([{"id": ingredient.id, "amount": 3}]),
+        )
+        response = self.client.post(self.url, data, format="multipart")
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(
+            sorted(data["tags"]), sorted(tag.id for tag in self.tags)
+        )
+        self.assertEqual(
+            data["ingredients"], [{"id": ingredient.id, "amount": 3}]
+        )
+        self.assertTrue(data["image"].endswith(".png"))
+
+    def test_variants_invalidate_cache(self):
+        recipe = self.recipes[0]
+        recipe.image = SimpleUploadedFile("recipe.png", create_png())
+        recipe.save()
+        generation = get_generation(recipe_cache.namespace)
+        with self.captureOnCommitCallbacks(execute=True):
+            generate_variants(recipe.id)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_variants["source"], recipe.image.name)
+        self.assertNotEqual(
+            get_generation(recipe_cache.namespace), generation
+        )
+
+
+class IngredientSearchTests(APITestCase):
+    "Поиск ингредиентов по префиксу и вхождению."
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for name in ("Сахар", "Сахарная пудра", "Ванильный сахар", "Соль"):
+            Ingredient.objects.create(name=name, measurement_unit="г")
+
+    def setUp(self):
+        super().setUp()
+        ingredient_catalog.bump()
+
+    def search(self, **params):
+        response = self.anonymous.get("/api/ingredients/", params)
+        self.assertEqual(response.status_code, 200)
+        return [ingredient["name"] for ingredient in response.json()]
+
+    def test_prefix(self):
+        self.assertEqual(
+            self.search(name="сах"), ["Сахар", "Сахарная пудра"]
+        )
+        self.assertEqual(self.search(name="СОЛ"), ["Соль"])
+
+    def test_contains_with_limit(self):
+        self.assertEqual(
+            self.search(name="сахар", limit=3),
+            ["Сахар", "Сахарная пудра", "Ванильный сахар"],
+        )
+        self.assertEqual(self.search(name="сахар", limit=1), ["Сахар"])
+
+
+class RecipeCursorTests(APITestCase):
+    "Постраничный вывод рецептов по курсору."
+
+    def test_walk_forward_and_back(self):
+        expected = list(
+            Recipe.objects.order_by("-pub_date", "-id").values_list(
+                "id", flat=True
+            )
+        )
+        pages = []
+        url, params = "/api/recipes/", {"cursor": "", "limit": 8}
+        while url:
+            response = self.anonymous.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            pages.append([recipe["id"] for recipe in page["results"]])
+            previous = page["previous"]
+            url, params = page["next"], None
+        self.assertEqual(sum(pages, []), expected)
+        response = self.anonymous.get(previous)
+        self.assertEqual(
+            [recipe["id"] for recipe in response.json()["results"]],
+            pages[-2],
+        )
+
+    def test_invalid_cursor(self):
+        response = self.anonymous.get("/api/recipes/", {"cursor": "broken"})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(RECIPES_CACHE_ENABLED=True)
+class AnonymousCacheTests(APITestCase):
+    "Кэш ответов для анонимных пользователей и его сброс."
+
+    def setUp(self):
+        super().setUp()
+        bump_generation(recipe_cache.namespace)
+        self.recipe = self.recipes[0]
+        self.url = f"/api/recipes/{self.recipe.id}/"
+
+    def test_hit_and_invalidation(self):
+        self.assertEqual(self.anonymous.get(self.url)["X-Cache"], "MISS")
+        self.assertEqual(self.anonymous.get(self.url)["X-Cache"], "HIT")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = "Борщ"
+            self.recipe.save()
+        response = self.anonymous.get(self.url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["name"], "Борщ")
+
+    def test_authenticated_not_cached(self):
+        self.anonymous.get(self.url)
+        response = self.client.get(self.url)
+        self.assertNotIn("X-Cache", response)
+        self.assertIn("is_favorited", response.json())
+
+
+class RecipeIngredientUpdateTests(APITestCase):
+    "Изменение только отличающихся ингредиентов рецепта."
+
+    def test_partial_update(self):
+        recipe = self.recipes[0]
+        author = APIClient()
+        author.force_authenticate(recipe.author)
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        kept = recipe.recipe_ingredients.get(ingredient=self.ingredients[0])
+        response = author.patch(
+            f"/api/recipes/{recipe.id}/",
+            {
+                "ingredients": [
+                    {"id": self.ingredients[0].id, "amount": 10},
+                    {"id": self.ingredients[2].id, "amount": 7},
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            dict(
+                recipe.recipe_ingredients.values_list(
+                    "ingredient_id", "amount"
+                )
+            ),
+            {self.ingredients[0].id: 10, self.ingredients[2].id: 7},
+        )
+        # Неизменённая строка не пересоздаётся.
+        self.assertTrue(
+            recipe.recipe_ingredients.filter(pk=kept.pk, amount=10).exists()
+        )
+        self.assertEqual(
+            dict(
+                self.user.shopping_list.values_list(
+                    "ingredient_id", "total_amount"
+                )
+            ),
+            {self.ingredients[0].id: 10, self.ingredients[2].id: 7},
+        )
+
+
+class RelationBatchTests(APITestCase):
+    "Пакетное добавление и удаление рецептов в избранном и корзине."
+
+    url = "/api/recipes/favorite/batch/"
+
+    def statuses(self, method, recipe_ids):
+        response = getattr(self.client, method)(
+            self.url, {"recipes": recipe_ids}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        return [
+            (result["id"], result["status"])
+            for result in response.json()["results"]
+        ]
+
+    def test_add_and_remove(self):
+        first, second = self.recipes[0].id, self.recipes[1].id
+        missing = Recipe.objects.order_by("-id").first().id + 1
+        self.assertEqual(
+            self.statuses("post", [first, second, first, missing]),
+            [(first, "added"), (second, "added"), (missing, "not_found")],
+        )
+        self.assertEqual(
+            self.statuses("post", [first]), [(first, "exists")]
+        )
+        self.assertEqual(
+            self.statuses("delete", [second, first]),
+            [(second, "removed"), (first, "removed")],
+        )
+        self.assertEqual(
+            self.statuses("delete", [first]), [(first, "missing")]
+        )
+        self.recipes[0].refresh_from_db()
+        self.assertEqual(self.recipes[0].favorites_count, 0)
+
+    def test_invalid_payload(self):
+        for recipes in ([], ["x"], [0]):
+            with self.subTest(recipes=recipes):
+                response = self.client.post(
+                    self.url, {"recipes": recipes}, format="json"
+                )
+                self.assertEqual(response.status_code, 400)
@@ -13,4 +13,5 @@ router.register("recipes", views.RecipeViewSet)
 urlpatterns = [
     path("", include(router.urls)),
     path("auth/", include("djoser.urls.authtoken")),
+    path("metrics/", views.MetricsView.as_view()),
 ]
@@ -1,24 +1,30 @@
 from django.conf import settings
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import Http404, HttpResponse
 from djoser.views import UserViewSet
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
 from rest_framework import mixins, response, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import get_object_or_404
-from rest_framework.permissions import (IsAuthenticated,
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.permissions import (IsAdminUser, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.views import APIView
 
 import api.serializers as serializers
+from api.cache import AnonymousCacheMixin
+from api.catalogs import CatalogMixin, ingredient_catalog, tag_catalog
+from api.exports import (CSVRenderer, PDFRenderer, TextRenderer,
+                         shopping_list_response)
+from api.metrics import registry
+from api.pagination import FeedPagination
 from api.permissions import IsOwnerOrReadOnly
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+from api.search import ingredient_index, search_recipes
+from recipes import relations
+from recipes.models import Ingredient, Recipe, Tag
 from users.models import Subscription, User
 
-FONT_FILE = (settings.BASE_DIR).joinpath(r"data/fonts/FreeSans.ttf")
-
 
 class ListCreateDeleteViewSet(
     mixins.ListModelMixin,
@@ -60,21 +66,50 @@ class CustomUserViewSet(UserViewSet):
         "Endpoint получения списка подписок."
 
         user = self.request.user
-        recipes_limit = self.request.GET.get("recipes_limit")
+        recipes_limit = self.get_recipes_limit()
         queryset = User.objects.filter(
             id__in=Subscription.objects.filter(subscriber=user.id).values(
                 "author_id",
             )
-        )
+        ).order_by(*User._meta.ordering)
         context = super().get_serializer_context()
         context.update({"recipes_limit": recipes_limit})
         page = self.paginate_queryset(queryset)
+        authors = page if page is not None else list(queryset)
+        self.prefetch_limited_recipes(authors, recipes_limit)
+        serializer = self.get_serializer(authors, context=context, many=True)
         if page is not None:
-            serializer = self.get_serializer(page, context=context, many=True)
             return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(queryset, context=context, many=True)
         return response.Response(serializer.data)
 
+    def get_recipes_limit(self):
+        "Параметр recipes_limit: не целое число игнорируется, <= 0 - ошибка."
+
+        recipes_limit = self.request.GET.get("recipes_limit")
+        try:
+            recipes_limit = int(recipes_limit)
+        except (TypeError, ValueError):
+            return None
+        if recipes_limit <= 0:
+            raise ValidationError(
+                {"recipes_limit": "Ожидается целое число больше нуля"}
+            )
+        return recipes_limit
+
+    @staticmethod
+    def prefetch_limited_recipes(authors, recipes_limit):
+        "Загрузка последних рецептов всех авторов страницы одним запросом."
+
+        recipes = Recipe.objects.all()
+        if recipes_limit is not None:
+            recipes = recipes.limited_per_author(
+                [author.id for author in authors], recipes_limit
+            )
+        prefetch_related_objects(
+            authors,
+            Prefetch("recipes", queryset=recipes, to_attr="limited_recipes"),
+        )
+
     @action(
         methods=["post", "delete"],
         detail=True,
@@ -87,33 +122,35 @@ class CustomUserViewSet(UserViewSet):
     def subscribe(self, request, *args, **kwargs):
         "Endpoint создания и удаления подписки."
 
-        author_id = self.kwargs.get("id")
-        recipes_limit = self.request.GET.get("recipes_limit")
-        author = get_object_or_404(User, pk=author_id)
-        if self.request.method == "POST":
-            context = super().get_serializer_context()
-            context.update({"recipes_limit": recipes_limit})
-            serializer = self.get_serializer(
-                data={
-                    "author": author.id,
-                },
-                context=context,
-            )
-            serializer.is_valid(raise_exception=True)
-            serializer.save(subscriber=self.request.user)
-            return response.Response(
-                serializer.data, status=status.HTTP_201_CREATED
-            )
-        instance = Subscription.objects.filter(
-            subscriber=self.request.user, author=author.id
-        )
-        if not instance.exists():
+        user = self.request.user
+        author = get_object_or_404(User, pk=self.kwargs.get("id"))
+        if self.request.method == "DELETE":
+            if not relations.subscriptions.remove(user.id, author.id):
+                return response.Response(
+                    data={"detail": "Подписка не существует"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            return response.Response(status=status.HTTP_204_NO_CONTENT)
+        recipes_limit = self.get_recipes_limit()
+        if author.id == user.id:
+            error = "Нельзя подписаться на самого себя"
+        elif not relations.subscriptions.add(user.id, author.id):
+            error = "Вы уже подписаны на этого автора"
+        else:
+            error = None
+        if error is not None:
             return response.Response(
-                data={"detail": "Подписка не существует"},
+                data={"non_field_errors": [error]},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        instance.delete()
-        return response.Response(status=status.HTTP_204_NO_CONTENT)
+        context = super().get_serializer_context()
+        context.update({"recipes_limit": recipes_limit})
+        serializer = serializers.SubscriptionsRepresentSerializer(
+            author, context=context
+        )
+        return response.Response(
+            serializer.data, status=status.HTTP_201_CREATED
+        )
 
     @action(["get"], detail=False)
     def me(self, request, *args, **kwargs):
@@ -134,31 +171,37 @@ class CustomUserViewSet(UserViewSet):
 #
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(CatalogMixin, viewsets.ReadOnlyModelViewSet):
     "Viewset для модели Tag."
 
     queryset = Tag.objects.all()
     serializer_class = serializers.TagSerializer
     pagination_class = None
+    catalog = tag_catalog
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogMixin, viewsets.ReadOnlyModelViewSet):
     "Viewset для модели Ingredient."
 
     queryset = Ingredient.objects.all()
     serializer_class = serializers.IngredientSerializer
     pagination_class = None
+    catalog = ingredient_catalog
 
-    def get_queryset(self):
-        queryset = Ingredient.objects.all()
-
+    def list(self, request, *args, **kwargs):
         name = self.request.GET.get("name")
-        if name:
-            queryset = queryset.filter(name__istartswith=name)
-        return queryset
-
-
-class RecipeViewSet(viewsets.ModelViewSet):
+        if not name:
+            return super().list(request, *args, **kwargs)
+        try:
+            limit = int(self.request.GET.get("limit"))
+        except (TypeError, ValueError):
+            limit = None
+        # Поиск идёт по индексу в памяти; фильтр name__istartswith
+        # остался только базой сравнения в benchmark_ingredient_search.
+        return response.Response(ingredient_index.search(name, limit))
+
+
+class RecipeViewSet(AnonymousCacheMixin, viewsets.ModelViewSet):
     "Viewset для модели Recipe."
 
     queryset = Recipe.objects.all()
@@ -166,18 +209,36 @@ class RecipeViewSet(viewsets.ModelViewSet):
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
     http_method_names = ["get", "post", "patch", "delete"]
+    # Картинка принимается как base64 в JSON или файлом в multipart,
+    # который Django записывает во временный файл порциями.
+    parser_classes = (JSONParser, MultiPartParser, FormParser)
 
     def get_queryset(self):
         queryset = Recipe.objects.all()
 
+        if self.action in ("list", "retrieve"):
+            # Признаки избранного, корзины и подписки вычисляются
+            # подзапросами EXISTS, а связанные объекты загружаются заранее,
+            # поэтому число запросов не зависит от размера страницы.
+            queryset = queryset.with_related().with_user_flags(
+                self.request.user
+            )
+
         tag_list = self.request.GET.getlist("tags")
         if tag_list:
-            queryset = queryset.filter(tags__slug__in=tag_list).distinct()
+            # Slug переводятся в id по справочнику тегов в памяти.
+            queryset = queryset.with_tags(
+                tag_catalog.get_ids("slug", tag_list)
+            )
 
         author = self.request.GET.get("author")
         if author:
             queryset = queryset.filter(author__id=author)
 
+        search = self.request.GET.get("search")
+        if search:
+            queryset = search_recipes(queryset, search)
+
         if self.request.user.is_anonymous:
             return queryset
 
@@ -207,41 +268,77 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return serializer.save(author=self.request.user)
 
     @action(
-        methods=["post", "delete"],
-        detail=True,
-        url_path="favorite",
+        methods=["get"],
+        detail=False,
+        url_path="feed",
         permission_classes=[
             IsAuthenticated,
         ],
+        pagination_class=FeedPagination,
     )
-    def favorite(self, request, *args, **kwargs):
-        "Endpoint добавления/удаления рецепта в/из избранного."
+    def feed(self, request, *args, **kwargs):
+        "Endpoint ленты рецептов авторов из подписок пользователя."
+
+        queryset = Recipe.objects.with_related().with_user_flags(
+            self.request.user
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def toggle_relation(self, relation, serializer_class, messages):
+        "Добавление/удаление связи рецепта с текущим пользователем."
 
         user = self.request.user
-        recipe_id = self.kwargs.get("pk")
-        recipe = get_object_or_404(Recipe, pk=recipe_id)
-        if self.request.method == "POST":
-            serializer = serializers.FavoriteSerializer(
-                data={
-                    "recipe": recipe.id,
-                    "user": user.id,
-                }
-            )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
+        try:
+            recipe_id = int(self.kwargs.get("pk"))
+        except ValueError:
+            raise Http404
+        if self.request.method == "DELETE":
+            if relation.remove(user.id, recipe_id):
+                return response.Response(status=status.HTTP_204_NO_CONTENT)
+            get_object_or_404(Recipe.objects.only("id"), pk=recipe_id)
             return response.Response(
-                serializer.data, status=status.HTTP_201_CREATED
+                data={"detail": messages["missing"]},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-        instance = Favorite.objects.filter(
-            user=self.request.user, recipe=recipe.id
+        recipe = get_object_or_404(
+            Recipe.objects.only(
+                "id", "name", "cooking_time", "image", "image_variants"
+            ),
+            pk=recipe_id,
         )
-        if not instance.exists():
+        if not relation.add(user.id, recipe.id):
             return response.Response(
-                data={"detail": "Рецепт не добавлен в избранное"},
+                data={"non_field_errors": [messages["exists"]]},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        instance.delete()
-        return response.Response(status=status.HTTP_204_NO_CONTENT)
+        serializer = serializer_class(
+            relation.model(user=user, recipe=recipe)
+        )
+        return response.Response(
+            serializer.data, status=status.HTTP_201_CREATED
+        )
+
+    @action(
+        methods=["post", "delete"],
+        detail=True,
+        url_path="favorite",
+        permission_classes=[
+            IsAuthenticated,
+        ],
+    )
+    def favorite(self, request, *args, **kwargs):
+        "Endpoint добавления/удаления рецепта в/из избранного."
+
+        return self.toggle_relation(
+            relations.favorites,
+            serializers.FavoriteSerializer,
+            {
+                "exists": "Вы уже добавили этот рецепт в избранное",
+                "missing": "Рецепт не добавлен в избранное",
+            },
+        )
 
     @action(
         methods=["post", "delete"],
@@ -254,31 +351,71 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def shopping_cart(self, request, *args, **kwargs):
         "Endpoint добавления/удаления рецепта в/из корзины."
 
-        user = self.request.user
-        recipe_id = self.kwargs.get("pk")
-        recipe = get_object_or_404(Recipe, pk=recipe_id)
-        if self.request.method == "POST":
-            serializer = serializers.ShoppingCartSerializer(
-                data={
-                    "recipe": recipe.id,
-                    "user": user.id,
-                }
-            )
-            serializer.is_valid(raise_exception=True)
-            serializer.save(user=self.request.user)
-            return response.Response(
-                serializer.data, status=status.HTTP_201_CREATED
-            )
-        instance = ShoppingCart.objects.filter(
-            user=self.request.user, recipe=recipe.id
+        return self.toggle_relation(
+            relations.shopping_cart,
+            serializers.ShoppingCartSerializer,
+            {
+                "exists": "Вы уже добавили этот рецепт в корзину",
+                "missing": "Рецепт не добавлен в корзину",
+            },
         )
-        if not instance.exists():
-            return response.Response(
-                data={"detail": "Рецепт не добавлен в корзину"},
-                status=status.HTTP_400_BAD_REQUEST,
+
+    def toggle_relation_batch(self, relation):
+        "Пакетное добавление/удаление рецептов с результатом по каждому id."
+
+        serializer = serializers.RecipeBatchSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data["recipes"]
+        user = self.request.user
+        if self.request.method == "DELETE":
+            changed = relation.remove_many(user.id, recipe_ids)
+            done, rest = "removed", "missing"
+        else:
+            changed = relation.add_many(user.id, recipe_ids)
+            done, rest = "added", "exists"
+        found = changed
+        if len(changed) < len(recipe_ids):
+            found = changed | set(
+                Recipe.objects.filter(pk__in=recipe_ids).values_list(
+                    "pk", flat=True
+                )
             )
-        instance.delete()
-        return response.Response(status=status.HTTP_204_NO_CONTENT)
+        results = []
+        for recipe_id in recipe_ids:
+            if recipe_id in changed:
+                result = done
+            elif recipe_id in found:
+                result = rest
+            else:
+                result = "not_found"
+            results.append({"id": recipe_id, "status": result})
+        return response.Response({"results": results})
+
+    @action(
+        methods=["post", "delete"],
+        detail=False,
+        url_path="favorite/batch",
+        permission_classes=[
+            IsAuthenticated,
+        ],
+    )
+    def favorite_batch(self, request, *args, **kwargs):
+        "Endpoint добавления/удаления нескольких рецептов в/из избранного."
+
+        return self.toggle_relation_batch(relations.favorites)
+
+    @action(
+        methods=["post", "delete"],
+        detail=False,
+        url_path="shopping_cart/batch",
+        permission_classes=[
+            IsAuthenticated,
+        ],
+    )
+    def shopping_cart_batch(self, request, *args, **kwargs):
+        "Endpoint добавления/удаления нескольких рецептов в/из корзины."
+
+        return self.toggle_relation_batch(relations.shopping_cart)
 
     @action(
         methods=["get"],
@@ -287,36 +424,40 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[
             IsAuthenticated,
         ],
+        renderer_classes=[PDFRenderer, TextRenderer, CSVRenderer],
     )
     def download_shopping_cart(self, request, *args, **kwargs):
         "Endpoint для скачивания списка продуктов из корзины."
 
-        purchases = (
-            RecipeIngredient.objects.filter(
-                recipe_id__in=ShoppingCart.objects.values("recipe_id")
-            )
-            .values("ingredient__name", "ingredient__measurement_unit")
-            .annotate(Sum("amount"))
+        return shopping_list_response(
+            self.request.user, self.request.accepted_renderer.format
         )
-        response = HttpResponse(content_type="application/pdf")
-        response[
-            "Content-Disposition"
-        ] = 'attachment; filename="ShoppingCart.pdf"'
-        p = canvas.Canvas(response)
-        pdfmetrics.registerFont(TTFont("FreeSans", FONT_FILE))
-        pos_y = 800
-        for item in purchases:
-            result = (
-                f'{item["ingredient__name"].capitalize()}'
-                f'({item["ingredient__measurement_unit"]}) - '
-                f'{item["amount__sum"]}'
-            )
-            p.setFont("FreeSans", 16)
-            pos_y -= 50
-            p.drawString(100, pos_y, result)
-            if pos_y == 50:
-                p.showPage()
-                pos_y = 800
-        p.showPage()
-        p.save()
+
+    def handle_exception(self, exc):
+        response = super().handle_exception(exc)
+        if self.action == "download_shopping_cart":
+            # Ошибки выгрузки (401, 406) отдаются в JSON, а не с типом
+            # файла выбранного формата.
+            renderer = JSONRenderer()
+            self.request.accepted_renderer = renderer
+            self.request.accepted_media_type = renderer.media_type
         return response
+
+
+#
+# Metrics
+#
+
+
+class MetricsView(APIView):
+    "Endpoint метрик в формате Prometheus для администраторов."
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        if not settings.METRICS_ENABLED:
+            raise Http404
+        return HttpResponse(
+            registry.render(),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
@@ -24,6 +24,23 @@ env = environ.Env(
     POSTGRES_PASSWORD=(str, "postgres"),
     DB_HOST=(str, "db"),
     DB_PORT=(str, "5432"),
+    RECIPES_CACHE_ENABLED=(bool, True),
+    RECIPES_CACHE_BACKEND=(
+        str,
+        "django.core.cache.backends.locmem.LocMemCache",
+    ),
+    RECIPES_CACHE_LOCATION=(str, "recipes"),
+    RECIPES_CACHE_TIMEOUT=(int, 300),
+    IMAGE_VARIANTS_ENABLED=(bool, True),
+    IMAGE_VARIANT_WORKERS=(int, 2),
+    RECIPE_IMAGE_MAX_SIZE=(int, 10 * 1024 * 1024),
+    SQL_INSTRUMENTATION_ENABLED=(bool, False),
+    SLOW_REQUEST_MS=(int, 500),
+    METRICS_ENABLED=(bool, False),
+    METRICS_DIR=(str, "/tmp/foodgram_metrics"),
+    METRICS_FLUSH_INTERVAL=(int, 5),
+    PROFILING_ENABLED=(bool, False),
+    PROFILE_DIR=(str, "/tmp/foodgram_profiles"),
 )
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -63,6 +80,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.metrics.MetricsMiddleware",
+    "api.instrumentation.SQLInstrumentationMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -70,6 +89,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "api.profiling.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "backend.urls"
@@ -109,6 +129,70 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+# Кэш ответов для анонимных пользователей. При нескольких воркерах
+# gunicorn следует использовать общий бэкенд (например, FileBasedCache),
+# иначе сброс кэша виден только в воркере, изменившем данные.
+RECIPES_CACHE_ENABLED = env("RECIPES_CACHE_ENABLED")
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "recipes": {
+        "BACKEND": env("RECIPES_CACHE_BACKEND"),
+        "LOCATION": env("RECIPES_CACHE_LOCATION"),
+        "TIMEOUT": env("RECIPES_CACHE_TIMEOUT"),
+    },
+}
+
+
+# Logging
+# https://docs.djangoproject.com/en/3.2/topics/logging/
+
+# Счётчики SQL и времени для каждого запроса (заголовок Server-Timing
+# и строка JSON в журнале api.instrumentation). Запросы дольше
+# SLOW_REQUEST_MS миллисекунд пишутся с уровнем WARNING.
+SQL_INSTRUMENTATION_ENABLED = env("SQL_INSTRUMENTATION_ENABLED")
+SLOW_REQUEST_MS = env("SLOW_REQUEST_MS")
+
+# Метрики запросов для Prometheus (/api/metrics/, только для
+# администраторов). Процессы gunicorn раз в METRICS_FLUSH_INTERVAL секунд
+# сохраняют свои значения в общий каталог METRICS_DIR.
+METRICS_ENABLED = env("METRICS_ENABLED")
+METRICS_DIR = env("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = env("METRICS_FLUSH_INTERVAL")
+
+# Профилирование запросов администраторов по заголовку X-Profile или
+# параметру ?profile=1; файлы pstats сохраняются в PROFILE_DIR.
+PROFILING_ENABLED = env("PROFILING_ENABLED")
+PROFILE_DIR = env("PROFILE_DIR")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {
+            "class": "logging.StreamHandler",
+        },
+    },
+    "loggers": {
+        "api.instrumentation": {
+            "handlers": ["console"],
+            "level": "INFO",
+            "propagate": False,
+        },
+        "api.profiling": {
+            "handlers": ["console"],
+            "level": "INFO",
+            "propagate": False,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -152,6 +236,29 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Максимальный размер картинки рецепта в байтах.
+RECIPE_IMAGE_MAX_SIZE = env("RECIPE_IMAGE_MAX_SIZE")
+
+# Загружаемые файлы больше этого размера записываются во временный файл
+# порциями, а не держатся в памяти воркера.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+
+# Конфигурация полнотекстового поиска рецептов в PostgreSQL.
+RECIPE_SEARCH_CONFIG = "russian"
+# Наибольшее число результатов поиска без PostgreSQL (поиск в памяти).
+RECIPE_SEARCH_FALLBACK_LIMIT = 1000
+
+# Наибольшее число рецептов в пакетном добавлении в избранное или корзину.
+RECIPE_BATCH_MAX_SIZE = 100
+
+# Рецепты авторов, у которых подписчиков больше этого числа, не
+# рассылаются по лентам при публикации, а читаются при запросе ленты.
+FEED_FANOUT_MAX_FOLLOWERS = 1000
+
+# Уменьшенные копии картинок рецептов строятся в фоновом пуле потоков.
+IMAGE_VARIANTS_ENABLED = env("IMAGE_VARIANTS_ENABLED")
+IMAGE_VARIANT_WORKERS = env("IMAGE_VARIANT_WORKERS")
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -1,7 +1,49 @@
+from collections import defaultdict
+
 from django.contrib import admin
 
+from . import relations
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingListItem, Tag)
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """Список без подсчёта всех записей таблицы при поиске и фильтрации.
+
+    Поиск "=" и "^" (UPPER(...) = и UPPER(...) LIKE) в PostgreSQL идёт по
+    индексам на UPPER от поля, созданным миграциями.
+    """
+
+    show_full_result_count = False
+
+
+class RelationAdmin(ScalableAdmin):
+    "Удаление связей через recipes.relations: со счётчиками и списками."
+
+    relation = None
+
+    def get_readonly_fields(self, request, obj=None):
+        # Сигналы учитывают только созданные и удалённые связи: смена
+        # пользователя или рецепта у существующей строки рассогласовала
+        # бы счётчики и списки покупок.
+        if obj is not None:
+            return (self.relation.owner, self.relation.target)
+        return super().get_readonly_fields(request, obj)
+
+    def delete_model(self, request, obj):
+        self.relation.remove(
+            getattr(obj, f"{self.relation.owner}_id"),
+            getattr(obj, f"{self.relation.target}_id"),
+        )
+
+    def delete_queryset(self, request, queryset):
+        targets = defaultdict(list)
+        for owner_id, target_id in queryset.values_list(
+            self.relation.owner, self.relation.target
+        ):
+            targets[owner_id].append(target_id)
+        for owner_id, target_ids in targets.items():
+            self.relation.remove_many(owner_id, target_ids)
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -16,9 +58,10 @@ class TagAdmin(admin.ModelAdmin):
         "color",
         "slug",
     )
+    search_fields = ("name", "slug")
 
 
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(ScalableAdmin):
     list_display = (
         "pk",
         "name",
@@ -28,34 +71,62 @@ class IngredientAdmin(admin.ModelAdmin):
         "name",
         "measurement_unit",
     )
-    list_filter = ("name",)
+    # Поиск по началу названия вместо фильтра со всеми значениями.
+    search_fields = ("^name",)
 
 
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(ScalableAdmin):
     list_display = (
         "pk",
         "author",
         "name",
+        "favorites_count",
+        "cart_count",
+        "pub_date",
     )
+    list_select_related = ("author",)
     fields = ("author", "name", "text", "image", "tags", "cooking_time")
-    list_filter = ("author", "name", "tags")
+    autocomplete_fields = ("author", "tags")
+    search_fields = ("^name", "=author__username")
+    list_filter = ("tags",)
 
 
-class RecipeIngredientAdmin(admin.ModelAdmin):
+class RecipeIngredientAdmin(ScalableAdmin):
     list_display = ("pk", "recipe", "ingredient", "amount")
+    list_select_related = ("recipe", "ingredient")
     fields = ("recipe", "ingredient", "amount")
+    autocomplete_fields = ("recipe", "ingredient")
+    search_fields = ("^recipe__name", "^ingredient__name")
 
 
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(RelationAdmin):
+    relation = relations.favorites
     list_display = ("pk", "user", "recipe")
+    list_select_related = ("user", "recipe")
     fields = ("user", "recipe")
-    list_filter = ("user", "recipe")
+    autocomplete_fields = ("user", "recipe")
+    search_fields = ("=user__username",)
 
 
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(RelationAdmin):
+    relation = relations.shopping_cart
     list_display = ("pk", "user", "recipe")
+    list_select_related = ("user", "recipe")
     fields = ("user", "recipe")
-    list_filter = ("user", "recipe")
+    autocomplete_fields = ("user", "recipe")
+    search_fields = ("=user__username",)
+
+
+class ShoppingListItemAdmin(ScalableAdmin):
+    list_display = ("pk", "user", "ingredient", "total_amount")
+    list_select_related = ("user", "ingredient")
+    fields = ("user", "ingredient", "total_amount")
+    # Список строится из корзины сигналами, правка вручную его ломает.
+    readonly_fields = fields
+    search_fields = ("=user__username",)
+
+    def has_add_permission(self, request):
+        return False
 
 
 admin.site.register(Tag, TagAdmin)
@@ -64,3 +135,4 @@ admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(RecipeIngredient, RecipeIngredientAdmin)
 admin.site.register(Favorite, FavoriteAdmin)
 admin.site.register(ShoppingCart, ShoppingCartAdmin)
+admin.site.register(ShoppingListItem, ShoppingListItemAdmin)
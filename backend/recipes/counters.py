@@ -0,0 +1,84 @@
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+
+@dataclass(frozen=True)
+class CounterField:
+    "Столбец model.field с числом строк related, ссылающихся полем key."
+
+    model: type
+    field: str
+    related: type
+    key: str
+
+    def change(self, pk, delta):
+        self.change_many([pk], delta)
+
+    def change_many(self, pks, delta):
+        "Атомарное изменение счётчика записей выражением F()."
+
+        queryset = self.model.objects.filter(pk__in=pks)
+        if delta < 0:
+            # Счётчик с расхождением не уходит ниже нуля до пересчёта.
+            queryset = queryset.filter(**{f"{self.field}__gte": -delta})
+        queryset.update(**{self.field: F(self.field) + delta})
+
+    def subtract(self, related):
+        "Уменьшение счётчиков на число строк queryset related модели связи."
+
+        pks_by_count = defaultdict(list)
+        for pk, count in (
+            related.order_by()
+            .values(self.key)
+            .annotate(count=Count("pk"))
+            .values_list(self.key, "count")
+        ):
+            pks_by_count[count].append(pk)
+        for count, pks in pks_by_count.items():
+            self.change_many(pks, -count)
+
+    def increment(self, instance):
+        self.change(getattr(instance, f"{self.key}_id"), 1)
+
+    def decrement(self, instance):
+        self.change(getattr(instance, f"{self.key}_id"), -1)
+
+    def actual(self):
+        "Подзапрос с фактическим числом связанных строк."
+
+        return Coalesce(
+            Subquery(
+                self.related.objects.filter(**{self.key: OuterRef("pk")})
+                .order_by()
+                .values(self.key)
+                .annotate(count=Count("pk"))
+                .values("count")
+            ),
+            0,
+        )
+
+    def recount(self, queryset=None):
+        "Исправление расхождений; возвращает число исправленных записей."
+
+        if queryset is None:
+            queryset = self.model.objects.all()
+        return (
+            queryset.annotate(actual=self.actual())
+            .exclude(**{self.field: F("actual")})
+            .update(**{self.field: self.actual()})
+        )
+
+
+FAVORITES = CounterField(Recipe, "favorites_count", Favorite, "recipe")
+CART = CounterField(Recipe, "cart_count", ShoppingCart, "recipe")
+RECIPES = CounterField(User, "recipes_count", Recipe, "author")
+FOLLOWERS = CounterField(User, "followers_count", Subscription, "author")
+COUNTERS = (FAVORITES, CART, RECIPES, FOLLOWERS)
+# Счётчик по модели связи: для каждой модели он единственный.
+COUNTER_BY_RELATED = {counter.related: counter for counter in COUNTERS}
@@ -0,0 +1,165 @@
+from django.conf import settings
+from django.db import connection, models
+
+from recipes.models import FeedEntry, Recipe
+from users.models import Subscription
+
+
+def insert_entries(entries):
+    """Вставка записей ленты из queryset со значениями entry_user,
+    entry_recipe, entry_author и entry_pub_date одним INSERT ... SELECT.
+    """
+
+    quote = connection.ops.quote_name
+    meta = FeedEntry._meta
+    columns = ", ".join(
+        quote(meta.get_field(name).column)
+        for name in ("user", "recipe", "author", "pub_date")
+    )
+    sql, params = entries.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"{connection.ops.insert_statement(ignore_conflicts=True)} "
+            f"{quote(meta.db_table)} ({columns}) {sql} "
+            f"{connection.ops.ignore_conflicts_suffix_sql(True)}",
+            params,
+        )
+
+
+def push_recipe(recipe):
+    "Рассылка нового рецепта по лентам подписчиков автора."
+
+    insert_entries(
+        Subscription.objects.filter(
+            author_id=recipe.author_id,
+            author__followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+        ).values(
+            entry_user=models.F("subscriber_id"),
+            entry_recipe=models.Value(recipe.pk),
+            entry_author=models.F("author_id"),
+            entry_pub_date=models.Value(
+                recipe.pub_date, output_field=models.DateTimeField()
+            ),
+        )
+    )
+
+
+def add_authors(subscriber_id, author_ids):
+    "Добавление в ленту рецептов авторов, на которых подписался пользователь."
+
+    insert_entries(
+        Recipe.objects.filter(
+            author_id__in=author_ids,
+            author__followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+        )
+        .order_by()
+        .values(
+            entry_user=models.Value(subscriber_id),
+            entry_recipe=models.F("id"),
+            entry_author=models.F("author_id"),
+            entry_pub_date=models.F("pub_date"),
+        )
+    )
+
+
+def add_subscriptions(subscriptions):
+    "Рассылка всех рецептов авторов по лентам из queryset подписок."
+
+    insert_entries(
+        subscriptions.filter(
+            author__followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+            author__recipes__isnull=False,
+        )
+        .order_by()
+        .values(
+            entry_user=models.F("subscriber_id"),
+            entry_recipe=models.F("author__recipes__id"),
+            entry_author=models.F("author_id"),
+            entry_pub_date=models.F("author__recipes__pub_date"),
+        )
+    )
+
+
+def backfill_authors(author_ids):
+    "Рассылка рецептов авторов, подписчиков которых стало не больше порога."
+
+    # Пока подписчиков было больше порога, рецепты автора читались
+    # напрямую и по лентам не рассылались. Вызывается после уменьшения
+    # счётчика на единицу, поэтому порог пересечён ровно при равенстве.
+    add_subscriptions(
+        Subscription.objects.filter(
+            author_id__in=author_ids,
+            author__followers_count=settings.FEED_FANOUT_MAX_FOLLOWERS,
+        )
+    )
+
+
+def apply_subscriptions(subscriber_id, author_ids, sign=1):
+    "Обновление ленты после подписки (sign=1) или отписки (sign=-1)."
+
+    if sign > 0:
+        add_authors(subscriber_id, author_ids)
+        return
+    FeedEntry.objects.filter(
+        user_id=subscriber_id, author_id__in=author_ids
+    ).delete()
+    backfill_authors(author_ids)
+
+
+def rebuild(subscriber_id):
+    "Пересборка ленты пользователя по текущим подпискам."
+
+    FeedEntry.objects.filter(user_id=subscriber_id).delete()
+    add_authors(
+        subscriber_id,
+        Subscription.objects.filter(subscriber_id=subscriber_id).values(
+            "author_id"
+        ),
+    )
+
+
+def keyset_filter(position, descending, id_field):
+    "Условие «после позиции (pub_date, id)» для сортировки ленты."
+
+    pub_date, recipe_id = position
+    lookup = "lt" if descending else "gt"
+    return models.Q(**{f"pub_date__{lookup}": pub_date}) | models.Q(
+        pub_date=pub_date, **{f"{id_field}__{lookup}": recipe_id}
+    )
+
+
+def get_recipe_ids(user_id, limit, position=None, descending=True):
+    """Не более limit id рецептов ленты после позиции курсора.
+
+    Записи, разосланные при публикации, объединяются с рецептами
+    популярных авторов, которые читаются напрямую. Каждый источник
+    отсортирован по (pub_date, id), поэтому первых limit строк каждого
+    достаточно; число запросов не зависит от количества подписок.
+    """
+
+    sign = "-" if descending else ""
+    pushed = FeedEntry.objects.filter(user_id=user_id)
+    pulled = Recipe.objects.filter(
+        author_id__in=Subscription.objects.filter(
+            subscriber_id=user_id,
+            author__followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+        ).values("author_id")
+    )
+    if position is not None:
+        pushed = pushed.filter(keyset_filter(position, descending, "recipe"))
+        pulled = pulled.filter(keyset_filter(position, descending, "id"))
+    # Автор мог стать популярным после рассылки: повторы убираются.
+    keys = set(
+        pushed.order_by(f"{sign}pub_date", f"{sign}recipe").values_list(
+            "pub_date", "recipe_id"
+        )[:limit]
+    )
+    keys.update(
+        pulled.order_by(f"{sign}pub_date", f"{sign}id").values_list(
+            "pub_date", "id"
+        )[:limit]
+    )
+    return [
+        recipe_id
+        for _, recipe_id in sorted(keys, reverse=descending)[:limit]
+    ]
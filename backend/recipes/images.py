@@ -0,0 +1,141 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models import Q
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANT_WIDTHS = (320, 640, 1280)
+# Формат в ответе API: (формат Pillow, расширение файла).
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "webp"),
+    "jpeg": ("JPEG", "jpg"),
+}
+VARIANT_QUALITY = 80
+VARIANTS_DIR = "recipes/images/variants"
+
+# Отправляется после записи копий картинки через update(), который не
+# вызывает post_save. sender - Recipe.
+variants_saved = Signal()
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    "Пул потоков процесса, создаётся при первой задаче."
+
+    return ThreadPoolExecutor(
+        max_workers=settings.IMAGE_VARIANT_WORKERS,
+        thread_name_prefix="image-variants",
+    )
+
+
+def variants_ready(recipe):
+    "Уменьшенные копии построены для текущей картинки рецепта."
+
+    return bool(recipe.image) and (
+        recipe.image_variants.get("source") == recipe.image.name
+    )
+
+
+def render_variant(image, width, pil_format):
+    variant = image.copy()
+    variant.thumbnail((width, variant.height))
+    if pil_format == "JPEG" and variant.mode != "RGB":
+        variant = variant.convert("RGB")
+    buffer = BytesIO()
+    variant.save(buffer, pil_format, quality=VARIANT_QUALITY)
+    return buffer.getvalue()
+
+
+def generate_variants(recipe_id):
+    "Построение уменьшенных копий картинки рецепта во всех форматах."
+
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image or variants_ready(recipe):
+        return
+    source = recipe.image.name
+    with recipe.image.open("rb") as image_file:
+        image = Image.open(image_file)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    stem = os.path.splitext(os.path.basename(source))[0]
+    # Картинки не увеличиваются: ширина ограничена оригиналом.
+    widths = sorted({min(width, image.width) for width in VARIANT_WIDTHS})
+    formats = {}
+    for format_name, (pil_format, extension) in VARIANT_FORMATS.items():
+        for width in widths:
+            name = default_storage.save(
+                f"{VARIANTS_DIR}/{stem}_{width}.{extension}",
+                ContentFile(render_variant(image, width, pil_format)),
+            )
+            formats.setdefault(format_name, {})[str(width)] = name
+
+    # Запись только для той же картинки и только если копии для неё ещё
+    # не записала другая задача.
+    updated = (
+        Recipe.objects.filter(pk=recipe_id, image=source)
+        .filter(
+            Q(image_variants__source__isnull=True)
+            | ~Q(image_variants__source=source)
+        )
+        .update(image_variants={"source": source, "formats": formats})
+    )
+    outdated = recipe.image_variants.get("formats", {})
+    if updated:
+        variants_saved.send(sender=Recipe, recipe_id=recipe_id)
+    else:
+        # Рецепт удалён, картинка заменена или копии уже построены:
+        # созданные файлы не нужны.
+        outdated = formats
+    delete_variants(outdated)
+
+
+def delete_variants(formats):
+    for paths in formats.values():
+        for path in paths.values():
+            default_storage.delete(path)
+
+
+def run_generate_variants(recipe_id):
+    try:
+        generate_variants(recipe_id)
+    except Exception:
+        logger.exception(
+            "Не удалось построить копии картинки рецепта %s", recipe_id
+        )
+    finally:
+        # Поток пула держит собственное соединение с БД.
+        connections.close_all()
+
+
+def image_changed(recipe):
+    "Картинка рецепта новая или заменена после загрузки из БД."
+
+    return getattr(recipe, "_loaded_image", None) != recipe.image.name
+
+
+def schedule_variants(recipe):
+    "Постановка построения копий в пул после фиксации транзакции."
+
+    if not image_changed(recipe):
+        return
+    # Повторное сохранение того же объекта не ставит задачу снова.
+    recipe._loaded_image = recipe.image.name
+    if not settings.IMAGE_VARIANTS_ENABLED or variants_ready(recipe):
+        return
+    recipe_id = recipe.pk
+    transaction.on_commit(
+        lambda: get_executor().submit(run_generate_variants, recipe_id)
+    )
@@ -0,0 +1,461 @@
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.signals import catalog_imported
+
+FORMATS = ("csv", "ndjson")
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
+# Количество строк, выводимых в режиме --dry-run для каждого вида
+# изменений.
+DIFF_PREVIEW = 20
+
+
+@dataclass
+class LoadResult:
+    "Итог загрузки справочника."
+
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    skipped: int = 0
+    conflicts: int = 0
+    created_preview: list = field(default_factory=list)
+    updated_preview: list = field(default_factory=list)
+    conflict_preview: list = field(default_factory=list)
+
+    def add_conflict(self, key, name, value):
+        self.conflicts += 1
+        if len(self.conflict_preview) < DIFF_PREVIEW:
+            self.conflict_preview.append((key, name, value))
+
+
+class RowReader:
+    "Потоковое чтение строк справочника из CSV или NDJSON."
+
+    def __init__(self, path, fields, file_format=None):
+        self.path = Path(path)
+        self.fields = fields
+        self.file_format = file_format or self.detect_format()
+        self.errors = []
+
+    def detect_format(self):
+        if self.path.suffix.lower() in NDJSON_SUFFIXES:
+            return "ndjson"
+        return "csv"
+
+    def __iter__(self):
+        with open(self.path, "r", encoding="utf-8") as datafile:
+            if self.file_format == "ndjson":
+                rows = self.read_ndjson(datafile)
+            else:
+                rows = self.read_csv(datafile)
+            for line, row in rows:
+                if row is None:
+                    continue
+                if len(row) != len(self.fields) or not all(row):
+                    self.errors.append((line, "неполная строка"))
+                    continue
+                yield tuple(value.strip() for value in row)
+
+    def read_csv(self, datafile):
+        # Файлы проекта без заголовка: столбцы идут в порядке fields.
+        for line, row in enumerate(csv.reader(datafile), start=1):
+            yield line, row or None
+
+    def read_ndjson(self, datafile):
+        for line, text in enumerate(datafile, start=1):
+            if not text.strip():
+                yield line, None
+                continue
+            try:
+                data = json.loads(text)
+                yield line, [str(data.get(name) or "") for name in self.fields]
+            except (ValueError, AttributeError):
+                self.errors.append((line, "некорректный JSON"))
+                yield line, None
+
+
+class RowStream(io.TextIOBase):
+    "Файлоподобный поток строк в формате CSV для COPY FROM STDIN."
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = ""
+        self.writer = csv.writer(self, lineterminator="\n")
+
+    def readable(self):
+        return True
+
+    def write(self, value):
+        self.buffer += value
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.writer.writerow(row)
+        if size < 0:
+            size = len(self.buffer)
+        try:
+            return self.buffer[:size]
+        finally:
+            self.buffer = self.buffer[size:]
+
+
+class CatalogLoader:
+    """Идемпотентная загрузка справочника.
+
+    Строки сопоставляются с записями по unique_fields. Новые записи
+    добавляются, существующие при update=True обновляются, иначе
+    остаются без изменений. Повторы внутри файла не прерывают загрузку:
+    побеждает последняя строка с тем же ключом. Строки, у которых
+    значение другого уникального поля (например, название тега при
+    ключе slug) уже принадлежит другой записи или более ранней строке
+    файла, не загружаются и учитываются как конфликты.
+    """
+
+    def __init__(
+        self,
+        model,
+        fields,
+        unique_fields,
+        batch_size=1000,
+        update=False,
+        progress=None,
+    ):
+        self.model = model
+        self.fields = tuple(fields)
+        self.unique_fields = tuple(unique_fields)
+        self.update_fields = tuple(
+            name for name in self.fields if name not in self.unique_fields
+        )
+        self.other_unique_fields = tuple(
+            name
+            for name in self.update_fields
+            if model._meta.get_field(name).unique
+        )
+        # Владельцы значений других уникальных полей: {поле: {значение:
+        # ключ}}, заполняется во время загрузки.
+        self.claimed = {}
+        self.batch_size = batch_size
+        self.update = update
+        self.progress = progress
+        self.max_lengths = [
+            model._meta.get_field(name).max_length for name in self.fields
+        ]
+
+    def get_key(self, row):
+        return tuple(
+            row[self.fields.index(name)] for name in self.unique_fields
+        )
+
+    def get_column(self, name):
+        return connection.ops.quote_name(
+            self.model._meta.get_field(name).column
+        )
+
+    def is_valid(self, row):
+        return all(
+            max_length is None or len(value) <= max_length
+            for value, max_length in zip(row, self.max_lengths)
+        )
+
+    def clean(self, rows, result):
+        for row in rows:
+            result.rows += 1
+            if not self.is_valid(row):
+                result.skipped += 1
+                continue
+            yield row
+            if self.progress and result.rows % self.batch_size == 0:
+                self.progress(result)
+
+    def batches(self, rows):
+        rows = iter(rows)
+        while True:
+            batch = {}
+            for row in islice(rows, self.batch_size):
+                batch[self.get_key(row)] = row
+            if not batch:
+                return
+            yield batch
+
+    def use_copy(self):
+        return connection.vendor == "postgresql"
+
+    def load(self, reader, dry_run=False):
+        "Загрузка строк reader; при dry_run база не изменяется."
+
+        result = LoadResult()
+        self.claimed = {name: {} for name in self.other_unique_fields}
+        rows = self.clean(reader, result)
+        if dry_run:
+            for batch in self.batches(rows):
+                self.diff_batch(batch, result)
+        else:
+            with transaction.atomic():
+                if self.use_copy():
+                    self.load_copy(rows, result)
+                else:
+                    for batch in self.batches(rows):
+                        self.load_batch(batch, result)
+        result.rows += len(reader.errors)
+        result.skipped += len(reader.errors)
+        if self.progress:
+            self.progress(result)
+        return result
+
+    def get_existing(self, batch):
+        "Записи базы с ключами из batch."
+
+        first = self.unique_fields[0]
+        values = {key[0] for key in batch}
+        existing = self.model.objects.filter(**{f"{first}__in": values})
+        return {
+            tuple(getattr(obj, name) for name in self.unique_fields): obj
+            for obj in existing
+        }
+
+    def drop_conflicts(self, batch, result):
+        "Исключение из batch строк, чьи уникальные значения заняты."
+
+        for name in self.other_unique_fields:
+            index = self.fields.index(name)
+            owners = {
+                value: tuple(key)
+                for value, *key in self.model.objects.filter(
+                    **{f"{name}__in": {row[index] for row in batch.values()}}
+                ).values_list(name, *self.unique_fields)
+            }
+            claimed = self.claimed[name]
+            for key, row in list(batch.items()):
+                value = row[index]
+                owner = claimed.setdefault(value, owners.get(value, key))
+                if owner != key:
+                    del batch[key]
+                    result.add_conflict(key, name, value)
+
+    def diff_batch(self, batch, result):
+        "Разделение batch на новые, изменённые и совпадающие записи."
+
+        self.drop_conflicts(batch, result)
+        existing = self.get_existing(batch)
+        created, updated = [], []
+        for key, row in batch.items():
+            obj = existing.get(key)
+            if obj is None:
+                created.append(self.model(**dict(zip(self.fields, row))))
+                continue
+            values = dict(zip(self.fields, row))
+            changes = {
+                name: (getattr(obj, name), values[name])
+                for name in self.update_fields
+                if getattr(obj, name) != values[name]
+            }
+            if not changes or not self.update:
+                result.unchanged += 1
+                continue
+            for name, (_, value) in changes.items():
+                setattr(obj, name, value)
+            updated.append(obj)
+            if len(result.updated_preview) < DIFF_PREVIEW:
+                result.updated_preview.append((key, changes))
+
+        result.created += len(created)
+        result.updated += len(updated)
+        free = DIFF_PREVIEW - len(result.created_preview)
+        result.created_preview.extend(
+            dict(zip(self.fields, row))
+            for row in islice(
+                (batch[key] for key in batch if key not in existing), free
+            )
+        )
+        return created, updated
+
+    def load_batch(self, batch, result):
+        created, updated = self.diff_batch(batch, result)
+        # Конфликты по всем уникальным полям уже исключены,
+        # ignore_conflicts защищает от записей, добавленных параллельно
+        # после чтения существующих.
+        self.model.objects.bulk_create(created, ignore_conflicts=True)
+        if updated:
+            self.model.objects.bulk_update(updated, self.update_fields)
+
+    def load_copy(self, rows, result):
+        "Загрузка через COPY во временную таблицу и INSERT ... ON CONFLICT."
+
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        staging = connection.ops.quote_name(
+            f"{self.model._meta.db_table}_staging"
+        )
+        columns = ", ".join(map(self.get_column, self.fields))
+        keys = ", ".join(map(self.get_column, self.unique_fields))
+        if self.update and self.update_fields:
+            updates = [self.get_column(name) for name in self.update_fields]
+            assignments = ", ".join(
+                f"{column} = EXCLUDED.{column}" for column in updates
+            )
+            distinct = " OR ".join(
+                f"{table}.{column} IS DISTINCT FROM EXCLUDED.{column}"
+                for column in updates
+            )
+            on_conflict = (
+                f"ON CONFLICT ({keys}) DO UPDATE SET {assignments} "
+                f"WHERE {distinct}"
+            )
+        else:
+            on_conflict = "ON CONFLICT DO NOTHING"
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+                f"SELECT {columns} FROM {table} WITH NO DATA"
+            )
+            cursor.cursor.copy_expert(
+                f"COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv)",
+                RowStream(rows),
+            )
+            for name in self.other_unique_fields:
+                self.delete_staged_conflicts(cursor, staging, name, result)
+            # Повторы ключа в файле: остаётся последняя строка.
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) "
+                f"SELECT DISTINCT ON ({keys}) {columns} FROM ("
+                f"SELECT *, ctid AS row_position FROM {staging}) AS staged "
+                f"ORDER BY {keys}, row_position DESC "
+                f"{on_conflict} RETURNING (xmax = 0)"
+            )
+            inserted = [row[0] for row in cursor.fetchall()]
+        result.created = sum(inserted)
+        result.updated = len(inserted) - result.created
+        result.unchanged = (
+            result.rows
+            - result.skipped
+            - result.conflicts
+            - result.created
+            - result.updated
+        )
+
+    def delete_staged_conflicts(self, cursor, staging, name, result):
+        """Удаление из временной таблицы строк с занятым значением name.
+
+        Значение занято другой записью или более ранней строкой с другим
+        ключом. Иначе INSERT прервался бы ошибкой уникальности (ON
+        CONFLICT с указанием ключа) или молча пропустил бы строку.
+        """
+
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        column = self.get_column(name)
+        keys = ", ".join(map(self.get_column, self.unique_fields))
+
+        def other_key(alias):
+            return ", ".join(
+                f"{alias}.{self.get_column(key)}"
+                for key in self.unique_fields
+            )
+
+        cursor.execute(
+            f"DELETE FROM {staging} AS staged WHERE EXISTS ("
+            f"SELECT 1 FROM {table} AS existing "
+            f"WHERE existing.{column} = staged.{column} "
+            f"AND ({other_key('existing')}) IS DISTINCT FROM "
+            f"({other_key('staged')})"
+            f") OR EXISTS ("
+            f"SELECT 1 FROM {staging} AS earlier "
+            f"WHERE earlier.{column} = staged.{column} "
+            f"AND earlier.ctid < staged.ctid "
+            f"AND ({other_key('earlier')}) IS DISTINCT FROM "
+            f"({other_key('staged')})"
+            f") RETURNING {keys}, {column}"
+        )
+        for *key, value in cursor.fetchall():
+            result.add_conflict(tuple(key), name, value)
+
+
+class CatalogImportCommand(BaseCommand):
+    "Основа команд загрузки справочников."
+
+    model = None
+    fields = ()
+    unique_fields = ()
+    default_path = None
+    success_message = "Справочник загружен"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            nargs="?",
+            default=self.default_path,
+            help="Файл CSV без заголовка или NDJSON.",
+        )
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="Формат файла; по умолчанию определяется по расширению.",
+        )
+        parser.add_argument(
+            "--update",
+            action="store_true",
+            help="Обновить отличающиеся поля существующих записей.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Показать изменения, не записывая их в базу.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Количество строк в одной пачке.",
+        )
+
+    def report_progress(self, result):
+        self.stdout.write(f"Обработано строк: {result.rows}\r", ending="")
+        self.stdout.flush()
+
+    def handle(self, *args, **options):
+        if not Path(options["path"]).is_file():
+            raise CommandError(f"Файл {options['path']} не найден")
+        reader = RowReader(options["path"], self.fields, options["format"])
+        loader = CatalogLoader(
+            self.model,
+            self.fields,
+            self.unique_fields,
+            batch_size=options["batch_size"],
+            update=options["update"],
+            progress=self.report_progress if options["verbosity"] else None,
+        )
+        result = loader.load(reader, dry_run=options["dry_run"])
+        self.stdout.write("")
+
+        for line, error in reader.errors[:DIFF_PREVIEW]:
+            self.stderr.write(f"Строка {line} пропущена: {error}")
+        for key, name, value in result.conflict_preview:
+            self.stderr.write(
+                f"{key} пропущена: {name} {value!r} уже занято"
+            )
+        if options["dry_run"]:
+            for values in result.created_preview:
+                self.stdout.write(f"+ {values}")
+            for key, changes in result.updated_preview:
+                self.stdout.write(f"~ {key}: {changes}")
+        self.stdout.write(
+            f"Строк: {result.rows}, добавлено: {result.created}, "
+            f"обновлено: {result.updated}, без изменений: "
+            f"{result.unchanged}, пропущено: {result.skipped}, "
+            f"конфликтов: {result.conflicts}"
+        )
+        if options["dry_run"]:
+            return
+        catalog_imported.send(sender=self.model)
+        self.stdout.write(self.style.SUCCESS(self.success_message))
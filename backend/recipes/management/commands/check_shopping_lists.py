@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import RecipeIngredient, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = "Сверка сводных списков покупок с корзинами пользователей."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Исправить найденные расхождения.",
+        )
+
+    def get_expected(self):
+        totals = (
+            RecipeIngredient.objects.filter(
+                recipe__shopping_cart__isnull=False
+            )
+            .values("recipe__shopping_cart__user", "ingredient")
+            .annotate(total=Sum("amount"))
+            .order_by()
+        )
+        return {
+            (row["recipe__shopping_cart__user"], row["ingredient"]): row[
+                "total"
+            ]
+            for row in totals.iterator()
+        }
+
+    def get_actual(self):
+        return {
+            (item.user_id, item.ingredient_id): item
+            for item in ShoppingListItem.objects.all().iterator()
+        }
+
+    def handle(self, *args, **options):
+        expected = self.get_expected()
+        actual = self.get_actual()
+        missing = expected.keys() - actual.keys()
+        extra = actual.keys() - expected.keys()
+        changed = [
+            key
+            for key in expected.keys() & actual.keys()
+            if expected[key] != actual[key].total_amount
+        ]
+        for key in sorted(missing):
+            self.stdout.write(f"Отсутствует {key}: {expected[key]}")
+        for key in sorted(extra):
+            self.stdout.write(
+                f"Лишняя запись {key}: {actual[key].total_amount}"
+            )
+        for key in sorted(changed):
+            self.stdout.write(
+                f"Расхождение {key}: {actual[key].total_amount} "
+                f"вместо {expected[key]}"
+            )
+        if not (missing or extra or changed):
+            self.stdout.write(self.style.SUCCESS("Расхождений не найдено"))
+            return
+        self.stdout.write(
+            f"Отсутствует: {len(missing)}, лишних: {len(extra)}, "
+            f"расхождений: {len(changed)}"
+        )
+        if not options["fix"]:
+            return
+
+        with transaction.atomic():
+            ShoppingListItem.objects.filter(
+                pk__in=[actual[key].pk for key in extra]
+            ).delete()
+            for key in changed:
+                actual[key].total_amount = expected[key]
+            ShoppingListItem.objects.bulk_update(
+                [actual[key] for key in changed],
+                ["total_amount"],
+                batch_size=1000,
+            )
+            ShoppingListItem.objects.bulk_create(
+                [
+                    ShoppingListItem(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        total_amount=expected[(user_id, ingredient_id)],
+                    )
+                    for user_id, ingredient_id in missing
+                ],
+                batch_size=1000,
+            )
+        self.stdout.write(self.style.SUCCESS("Расхождения исправлены"))
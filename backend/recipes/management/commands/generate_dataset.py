@@ -0,0 +1,395 @@
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+from io import BytesIO
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image
+
+from recipes import feed
+from recipes.counters import COUNTERS
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingListItem, Tag)
+from users.models import Subscription, User
+
+PLACEHOLDER_IMAGE = "recipes/images/placeholder.png"
+PASSWORD = "password"
+# Период, на который распределяются даты публикации рецептов.
+HISTORY_DAYS = 365
+CART_FIELDS = ("user", "recipe")
+LIST_FIELDS = ("user", "ingredient", "total_amount")
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ZipfSampler:
+    "Выбор элементов с вероятностью, обратной степени ранга."
+
+    def __init__(self, rng, items, exponent):
+        self.rng = rng
+        # Ранги перемешаны, чтобы популярность не зависела от id.
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cum_weights = list(
+            accumulate(
+                1 / rank**exponent for rank in range(1, len(self.items) + 1)
+            )
+        )
+
+    def sample(self, count):
+        return self.rng.choices(
+            self.items, cum_weights=self.cum_weights, k=count
+        )
+
+    def sample_unique(self, count, exclude=None):
+        "До count различных элементов, кроме exclude."
+
+        count = min(count, len(self.items) - (exclude is not None))
+        chosen = set()
+        attempts = 0
+        while len(chosen) < count and attempts < 10:
+            chosen.update(self.sample(count - len(chosen)))
+            chosen.discard(exclude)
+            attempts += 1
+        return chosen
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерация синтетических пользователей, рецептов, избранного, "
+        "корзин и подписок для нагрузочного тестирования."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--recipes", type=int, default=10000)
+        parser.add_argument("--favorites", type=int, default=50000)
+        parser.add_argument("--cart", type=int, default=20000)
+        parser.add_argument("--subscriptions", type=int, default=20000)
+        parser.add_argument(
+            "--ingredients",
+            type=int,
+            nargs=2,
+            default=(3, 10),
+            metavar=("MIN", "MAX"),
+            help="Диапазон количества ингредиентов в рецепте.",
+        )
+        parser.add_argument(
+            "--zipf",
+            type=float,
+            default=1.1,
+            help="Показатель распределения Ципфа для популярности.",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--prefix",
+            help="Префикс имён пользователей; по умолчанию gen<seed>.",
+        )
+
+    def stage(self, message):
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(f"[{elapsed:7.1f} с] {message}")
+
+    def handle(self, *args, **options):
+        self.started = time.monotonic()
+        self.options = options
+        self.batch_size = options["batch_size"]
+        self.seed = options["seed"]
+        self.rng = random.Random(self.seed)
+        self.prefix = options["prefix"] or f"gen{self.seed}"
+
+        self.ingredient_ids = list(
+            Ingredient.objects.order_by("id").values_list("id", flat=True)
+        )
+        self.tag_ids = list(
+            Tag.objects.order_by("id").values_list("id", flat=True)
+        )
+        if not self.ingredient_ids or not self.tag_ids:
+            raise CommandError(
+                "Сначала загрузите справочники: import_ingredients, "
+                "import_tags"
+            )
+        if User.objects.filter(username__startswith=self.prefix).exists():
+            raise CommandError(
+                f"Пользователи с префиксом {self.prefix} уже есть; "
+                "укажите другой --seed или --prefix"
+            )
+
+        self.ensure_placeholder()
+        with transaction.atomic():
+            user_ids = self.create_users(options["users"])
+            recipe_ids = self.create_recipes(user_ids, options["recipes"])
+            self.create_subscriptions(user_ids, options["subscriptions"])
+            self.create_favorites(user_ids, recipe_ids, options["favorites"])
+            self.create_cart(user_ids, recipe_ids, options["cart"])
+            self.update_counters(user_ids, recipe_ids)
+            self.create_feeds(user_ids)
+        self.stage(self.style.SUCCESS("Набор данных создан"))
+
+    def ensure_placeholder(self):
+        if default_storage.exists(PLACEHOLDER_IMAGE):
+            return
+        buffer = BytesIO()
+        Image.new("RGB", (1280, 960), "#d9d9d9").save(buffer, "PNG")
+        default_storage.save(PLACEHOLDER_IMAGE, ContentFile(buffer.getvalue()))
+
+    def last_id(self, model):
+        return (
+            model.objects.order_by("-id").values_list("id", flat=True).first()
+            or 0
+        )
+
+    def ids_after(self, model, last_id):
+        # SQLite не возвращает id из пакетной вставки: новые записи
+        # читаются по возрастанию id после последней существовавшей.
+        return list(
+            model.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+    def insert_rows(self, model, fields, rows):
+        "Вставка кортежей значений многострочными INSERT без моделей."
+
+        columns = [model._meta.get_field(name).column for name in fields]
+        sql = "INSERT INTO {} ({}) VALUES ".format(
+            connection.ops.quote_name(model._meta.db_table),
+            ", ".join(map(connection.ops.quote_name, columns)),
+        )
+        row_sql = "({})".format(", ".join(["%s"] * len(columns)))
+        rows_per_query = connection.ops.bulk_batch_size(
+            columns, [None] * self.batch_size
+        )
+        count = 0
+        with connection.cursor() as cursor:
+            for chunk in chunked(rows, rows_per_query):
+                cursor.execute(
+                    sql + ", ".join([row_sql] * len(chunk)),
+                    [value for row in chunk for value in row],
+                )
+                count += len(chunk)
+        return count
+
+    def create_users(self, total):
+        password = make_password(PASSWORD)
+        last_id = self.last_id(User)
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f"{self.prefix}_{number}",
+                    email=f"{self.prefix}_{number}@example.com",
+                    first_name=f"Имя{number}",
+                    last_name=f"Фамилия{number}",
+                    password=password,
+                )
+                for number in range(total)
+            ),
+            batch_size=self.batch_size,
+        )
+        user_ids = self.ids_after(User, last_id)
+        self.stage(f"Пользователи: {len(user_ids)}")
+        return user_ids
+
+    def recipe_ingredients(self, index):
+        "Ингредиенты рецепта; воспроизводятся по номеру без хранения."
+
+        rng = random.Random(f"{self.seed}:{index}")
+        low, high = self.options["ingredients"]
+        count = min(rng.randint(low, high), len(self.ingredient_ids))
+        return [
+            (ingredient_id, rng.randint(1, 500))
+            for ingredient_id in rng.sample(self.ingredient_ids, count)
+        ]
+
+    def create_recipes(self, user_ids, total):
+        # Немногие авторы публикуют большую часть рецептов.
+        authors = ZipfSampler(self.rng, user_ids, self.options["zipf"])
+        start = timezone.now() - timedelta(days=HISTORY_DAYS)
+        step = timedelta(days=HISTORY_DAYS) / max(total, 1)
+        last_id = self.last_id(Recipe)
+        self.insert_rows(
+            Recipe,
+            (
+                "author",
+                "name",
+                "text",
+                "image",
+                "image_variants",
+                "cooking_time",
+                "pub_date",
+                "favorites_count",
+                "cart_count",
+            ),
+            (
+                (
+                    author_id,
+                    f"Рецепт {number}",
+                    f"Описание синтетического рецепта {number}.",
+                    PLACEHOLDER_IMAGE,
+                    "{}",
+                    self.rng.randint(5, 180),
+                    connection.ops.adapt_datetimefield_value(
+                        start + step * number
+                    ),
+                    0,
+                    0,
+                )
+                for number, author_id in enumerate(authors.sample(total))
+            ),
+        )
+        recipe_ids = self.ids_after(Recipe, last_id)
+        self.stage(f"Рецепты: {len(recipe_ids)}")
+
+        self.recipe_index = {
+            recipe_id: index for index, recipe_id in enumerate(recipe_ids)
+        }
+        count = self.insert_rows(
+            RecipeIngredient,
+            ("recipe", "ingredient", "amount"),
+            (
+                (recipe_id, ingredient_id, amount)
+                for index, recipe_id in enumerate(recipe_ids)
+                for ingredient_id, amount in self.recipe_ingredients(index)
+            ),
+        )
+        self.stage(f"Ингредиенты в рецептах: {count}")
+        # Вставка идёт в обход save(), поэтому векторы поиска
+        # заполняются отдельно (только в PostgreSQL).
+        Recipe.objects.filter(id__gt=last_id).update_search_vector()
+
+        max_tags = min(3, len(self.tag_ids))
+        count = self.insert_rows(
+            Recipe.tags.through,
+            ("recipe", "tag"),
+            (
+                (recipe_id, tag_id)
+                for recipe_id in recipe_ids
+                for tag_id in self.rng.sample(
+                    self.tag_ids, self.rng.randint(1, max_tags)
+                )
+            ),
+        )
+        self.stage(f"Теги рецептов: {count}")
+        return recipe_ids
+
+    def distribute(self, user_ids, total):
+        "Число записей на пользователя: активность тоже неравномерна."
+
+        activity = ZipfSampler(self.rng, user_ids, self.options["zipf"] / 2)
+        return Counter(activity.sample(total))
+
+    def pairs(self, user_ids, targets, total, exclude_self=False):
+        "Уникальные пары (пользователь, объект) с популярностью по Ципфу."
+
+        popularity = ZipfSampler(self.rng, targets, self.options["zipf"])
+        for user_id, count in sorted(
+            self.distribute(user_ids, total).items()
+        ):
+            exclude = user_id if exclude_self else None
+            for target_id in sorted(
+                popularity.sample_unique(count, exclude=exclude)
+            ):
+                yield user_id, target_id
+
+    def create_subscriptions(self, user_ids, total):
+        # У немногих авторов большая часть подписчиков.
+        start = timezone.now() - timedelta(days=HISTORY_DAYS)
+        seconds = HISTORY_DAYS * 86400
+        count = self.insert_rows(
+            Subscription,
+            ("subscriber", "author", "created"),
+            (
+                (
+                    user_id,
+                    author_id,
+                    connection.ops.adapt_datetimefield_value(
+                        start + timedelta(seconds=self.rng.randint(0, seconds))
+                    ),
+                )
+                for user_id, author_id in self.pairs(
+                    user_ids, user_ids, total, exclude_self=True
+                )
+            ),
+        )
+        self.stage(f"Подписки: {count}")
+
+    def create_favorites(self, user_ids, recipe_ids, total):
+        count = self.insert_rows(
+            Favorite,
+            ("user", "recipe"),
+            self.pairs(user_ids, recipe_ids, total),
+        )
+        self.stage(f"Избранное: {count}")
+
+    def update_counters(self, user_ids, recipe_ids):
+        # Строки вставлены в обход сигналов: счётчики новых пользователей
+        # и рецептов пересчитываются по таблицам связей.
+        for counter in COUNTERS:
+            ids = user_ids if counter.model is User else recipe_ids
+            if ids:
+                counter.recount(counter.model.objects.filter(id__gte=ids[0]))
+        self.stage("Счётчики пересчитаны")
+
+    def create_feeds(self, user_ids):
+        # После пересчёта счётчиков: рассылка зависит от числа
+        # подписчиков автора. Подписки есть только у новых пользователей.
+        if user_ids:
+            feed.add_subscriptions(
+                Subscription.objects.filter(subscriber_id__gte=user_ids[0])
+            )
+        self.stage("Ленты подписок построены")
+
+    def create_cart(self, user_ids, recipe_ids, total):
+        # bulk_create не отправляет сигналы, поэтому сводные списки
+        # покупок строятся здесь же, по одному пользователю за раз.
+        cart = []
+        items = []
+        user_totals = defaultdict(int)
+        current_user = None
+        cart_count = items_count = 0
+
+        def flush_user():
+            items.extend(
+                (current_user, ingredient_id, amount)
+                for ingredient_id, amount in user_totals.items()
+            )
+            user_totals.clear()
+
+        for user_id, recipe_id in self.pairs(user_ids, recipe_ids, total):
+            if user_id != current_user:
+                flush_user()
+                current_user = user_id
+            cart.append((user_id, recipe_id))
+            for ingredient_id, amount in self.recipe_ingredients(
+                self.recipe_index[recipe_id]
+            ):
+                user_totals[ingredient_id] += amount
+            if len(cart) >= self.batch_size:
+                cart_count += self.insert_rows(ShoppingCart, CART_FIELDS, cart)
+                cart.clear()
+            if len(items) >= self.batch_size:
+                items_count += self.insert_rows(
+                    ShoppingListItem, LIST_FIELDS, items
+                )
+                items.clear()
+        flush_user()
+        cart_count += self.insert_rows(ShoppingCart, CART_FIELDS, cart)
+        items_count += self.insert_rows(ShoppingListItem, LIST_FIELDS, items)
+        self.stage(
+            f"Корзины: {cart_count}, строк списков покупок: {items_count}"
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_variants, variants_ready
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Построение уменьшенных копий картинок рецептов, где их нет."
+
+    def handle(self, *args, **kwargs):
+        recipes = Recipe.objects.only("id", "image", "image_variants")
+        generated = 0
+        for recipe in recipes.iterator():
+            if variants_ready(recipe):
+                continue
+            try:
+                generate_variants(recipe.id)
+            except (OSError, ValueError) as e:
+                self.stderr.write(f"Рецепт {recipe.id}: {e}")
+                continue
+            generated += 1
+        self.stdout.write(
+            self.style.SUCCESS(f"Построены копии для рецептов: {generated}")
+        )
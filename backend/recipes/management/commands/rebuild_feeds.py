@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes import feed
+from recipes.models import FeedEntry
+from users.models import Subscription
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересборка лент подписок, например после изменения "
+        "FEED_FANOUT_MAX_FOLLOWERS или загрузки в обход сигналов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "users",
+            nargs="*",
+            type=int,
+            help="id пользователей; по умолчанию все ленты.",
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        user_ids = options["users"]
+        if user_ids:
+            for user_id in user_ids:
+                feed.rebuild(user_id)
+            rebuilt = len(user_ids)
+        else:
+            # Все ленты одним INSERT ... SELECT.
+            FeedEntry.objects.all().delete()
+            feed.add_subscriptions(Subscription.objects.all())
+            rebuilt = (
+                Subscription.objects.order_by()
+                .values("subscriber_id")
+                .distinct()
+                .count()
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Пересобрано лент: {rebuilt}, "
+                f"записей: {FeedEntry.objects.count()}"
+            )
+        )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import COUNTERS
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчёт счётчиков избранного, корзин, рецептов и подписчиков "
+        "по таблицам связей."
+    )
+
+    def handle(self, *args, **options):
+        fixed = 0
+        for counter in COUNTERS:
+            with transaction.atomic():
+                count = counter.recount()
+            fixed += count
+            self.stdout.write(
+                f"{counter.model._meta.label}.{counter.field}: "
+                f"исправлено {count}"
+            )
+        if fixed:
+            self.stdout.write(
+                self.style.SUCCESS(f"Исправлено записей: {fixed}")
+            )
+            return
+        self.stdout.write(self.style.SUCCESS("Расхождений не найдено"))
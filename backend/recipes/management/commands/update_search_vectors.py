@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчёт поисковых векторов рецептов, например после массовой "
+        "загрузки в обход save()."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            self.stdout.write(
+                "Поисковые векторы хранятся только в PostgreSQL; "
+                "в других СУБД поиск выполняется в памяти"
+            )
+            return
+        updated = 0
+        last_id = 0
+        while True:
+            ids = list(
+                Recipe.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", flat=True)[: options["batch_size"]]
+            )
+            if not ids:
+                break
+            Recipe.objects.filter(id__in=ids).update_search_vector()
+            updated += len(ids)
+            last_id = ids[-1]
+        self.stdout.write(
+            self.style.SUCCESS(f"Обновлены векторы рецептов: {updated}")
+        )
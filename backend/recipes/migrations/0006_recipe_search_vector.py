@@ -0,0 +1,56 @@
+# Generated by Django 3.2 on 2026-10-18 05:40
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+# GIN-индекс и заполнение векторов существуют только в PostgreSQL: в
+# других СУБД поиск выполняется в памяти процесса.
+CREATE_INDEX = (
+    "CREATE INDEX recipe_search_vector_idx ON recipes_recipe "
+    "USING gin (search_vector)"
+)
+DROP_INDEX = "DROP INDEX IF EXISTS recipe_search_vector_idx"
+FILL_VECTORS = """
+UPDATE recipes_recipe AS recipe SET search_vector =
+    setweight(to_tsvector(%(config)s::regconfig, coalesce(recipe.name, '')),
+              'A')
+    || setweight(to_tsvector(%(config)s::regconfig, coalesce((
+        SELECT string_agg(ingredient.name, ' ')
+        FROM recipes_recipeingredient AS recipe_ingredient
+        JOIN recipes_ingredient AS ingredient
+            ON ingredient.id = recipe_ingredient.ingredient_id
+        WHERE recipe_ingredient.recipe_id = recipe.id
+    ), '')), 'B')
+    || setweight(to_tsvector(%(config)s::regconfig, coalesce(recipe.text, '')),
+                 'C')
+"""
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(FILL_VECTORS, {"config": settings.RECIPE_SEARCH_CONFIG})
+    schema_editor.execute(CREATE_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_search_vector'),
+    ]
+
+    # Составной индекс по (tag_id, recipe_id) покрывает подзапрос EXISTS
+    # фильтра по тегам. Уникальное ограничение таблицы начинается с
+    # recipe_id и поиск по тегу не ускоряет. Таблица связи создана
+    # ManyToManyField, поэтому индекс задаётся SQL, а не в Meta модели.
+    operations = [
+        migrations.RunSQL(
+            "CREATE INDEX recipe_tags_tag_recipe_idx "
+            "ON recipes_recipe_tags (tag_id, recipe_id)",
+            "DROP INDEX recipe_tags_tag_recipe_idx",
+        ),
+    ]
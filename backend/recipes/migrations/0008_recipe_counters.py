@@ -0,0 +1,55 @@
+# Generated by Django 3.2 on 2026-10-18 05:35
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+# (модель, счётчик, модель связи, поле связи)
+COUNTERS = (
+    ("recipes.Recipe", "favorites_count", "recipes.Favorite", "recipe"),
+    ("recipes.Recipe", "cart_count", "recipes.ShoppingCart", "recipe"),
+    ("users.User", "recipes_count", "recipes.Recipe", "author"),
+    ("users.User", "followers_count", "users.Subscription", "author"),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model_name, field, related_name, key in COUNTERS:
+        related = apps.get_model(related_name)
+        apps.get_model(model_name).objects.update(
+            **{
+                field: Coalesce(
+                    models.Subquery(
+                        related.objects.filter(
+                            **{key: models.OuterRef("pk")}
+                        )
+                        .order_by()
+                        .values(key)
+                        .annotate(count=models.Count("pk"))
+                        .values("count")
+                    ),
+                    0,
+                )
+            }
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_counters'),
+        ('recipes', '0007_recipe_tags_tag_recipe_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В корзинах'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
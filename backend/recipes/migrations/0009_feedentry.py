@@ -0,0 +1,54 @@
+# Generated by Django 3.2 on 2026-10-18 05:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Записи лент для существующих подписок на авторов, чьи рецепты
+# рассылаются при публикации.
+FILL_FEEDS = """
+INSERT INTO recipes_feedentry (user_id, recipe_id, author_id, pub_date)
+SELECT subscription.subscriber_id, recipe.id, recipe.author_id, recipe.pub_date
+FROM users_subscription AS subscription
+JOIN users_user AS author ON author.id = subscription.author_id
+JOIN recipes_recipe AS recipe ON recipe.author_id = subscription.author_id
+WHERE author.followers_count <= %s
+"""
+
+
+def fill_feeds(apps, schema_editor):
+    schema_editor.execute(FILL_FEEDS, [settings.FEED_FANOUT_MAX_FOLLOWERS])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='recipes.recipe')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='feed', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи лент',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='feedentry_user_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feedentry'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# Поиск в админке ("^name") сравнивает UPPER(name::text) LIKE 'X%': нужен
+# индекс по выражению с text_pattern_ops. Только PostgreSQL.
+INDEXES = {
+    "recipe_name_upper_idx": "recipes_recipe",
+    "ingredient_name_upper_idx": "recipes_ingredient",
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, table in INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX {name} ON {table} "
+            "(UPPER(name::text) text_pattern_ops)"
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_feedentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -1,8 +1,16 @@
+from collections import defaultdict
+
 from colorfield.fields import ColorField
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, SearchVectorField)
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, RowNumber
 
-from users.models import User
+from users.models import Subscription, User
 
 
 def validate_gt_zero(value):
@@ -60,6 +68,129 @@ class Ingredient(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    "QuerySet рецептов с данными, предвычисленными для сериализации."
+
+    def with_related(self):
+        "Загрузка автора, тегов и ингредиентов фиксированным числом запросов."
+
+        return self.select_related("author").prefetch_related(
+            "tags",
+            models.Prefetch(
+                "recipe_ingredients",
+                queryset=RecipeIngredient.objects.select_related(
+                    "ingredient"
+                ),
+            ),
+        )
+
+    def with_user_flags(self, user):
+        "Аннотация признаков избранного, корзины и подписки на автора."
+
+        if user.is_anonymous:
+            return self
+        return self.annotate(
+            is_favorited=models.Exists(
+                Favorite.objects.filter(
+                    user=user, recipe=models.OuterRef("pk")
+                )
+            ),
+            is_in_shopping_cart=models.Exists(
+                ShoppingCart.objects.filter(
+                    user=user, recipe=models.OuterRef("pk")
+                )
+            ),
+            author_subscribed=models.Exists(
+                Subscription.objects.filter(
+                    subscriber=user, author=models.OuterRef("author")
+                )
+            ),
+        )
+
+    def with_tags(self, tag_ids):
+        "Рецепты хотя бы с одним из тегов: EXISTS без JOIN и DISTINCT."
+
+        if not tag_ids:
+            return self.none()
+        return self.filter(
+            models.Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe=models.OuterRef("pk"), tag_id__in=tag_ids
+                )
+            )
+        )
+
+    def search(self, text):
+        "Полнотекстовый поиск с аннотацией релевантности search_rank."
+
+        query = SearchQuery(
+            text, config=settings.RECIPE_SEARCH_CONFIG, search_type="websearch"
+        )
+        # ts_rank возвращает real, а курсор хранит значение после
+        # преобразования в double precision: без приведения равенство
+        # рангов в условии курсора не выполняется и рецепты с одинаковым
+        # рангом пропускаются или повторяются между страницами.
+        rank = Cast(
+            SearchRank(models.F("search_vector"), query),
+            models.FloatField(),
+        )
+        return (
+            self.filter(search_vector=query)
+            .annotate(search_rank=rank)
+            .order_by("-search_rank", *Recipe._meta.ordering)
+        )
+
+    def update_search_vector(self):
+        "Пересчёт поискового вектора рецептов; только для PostgreSQL."
+
+        if connection.vendor != "postgresql":
+            return
+        config = settings.RECIPE_SEARCH_CONFIG
+        ingredient_names = models.Subquery(
+            RecipeIngredient.objects.filter(recipe=models.OuterRef("pk"))
+            .order_by()
+            .values("recipe")
+            .annotate(names=StringAgg("ingredient__name", " "))
+            .values("names")
+        )
+        self.update(
+            search_vector=SearchVector("name", weight="A", config=config)
+            + SearchVector(ingredient_names, weight="B", config=config)
+            + SearchVector("text", weight="C", config=config)
+        )
+
+    def limited_per_author(self, author_ids, limit):
+        "Не более limit последних рецептов каждого из авторов одним запросом."
+
+        if not author_ids:
+            # Пустой IN не компилируется в SQL (EmptyResultSet).
+            return self.none()
+        # Django 3.2 не умеет фильтровать по оконным функциям, поэтому
+        # нумерация рецептов внутри автора вынесена в подзапрос.
+        ranked = (
+            Recipe.objects.filter(author_id__in=author_ids)
+            .annotate(
+                author_rank=models.Window(
+                    expression=RowNumber(),
+                    partition_by=[models.F("author_id")],
+                    order_by=[
+                        models.F("pub_date").desc(),
+                        models.F("id").desc(),
+                    ],
+                )
+            )
+            .values("id", "author_rank")
+        )
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(
+            pk__in=RawSQL(
+                f"SELECT ranked.id FROM ({sql}) ranked "
+                "WHERE ranked.author_rank <= %s",
+                (*params, limit),
+            )
+        )
+
+
 class Recipe(models.Model):
 
     author = models.ForeignKey(
@@ -79,6 +210,13 @@ class Recipe(models.Model):
         upload_to="recipes/images/",
         verbose_name="Картинка",
     )
+    # Уменьшенные копии картинки: {"source": имя оригинала,
+    # "formats": {формат: {ширина: имя файла}}}. Заполняется в фоне.
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name="Копии картинки",
+    )
     ingredients = models.ManyToManyField(
         Ingredient, through="RecipeIngredient", verbose_name="Ингридиенты"
     )
@@ -90,15 +228,96 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name="Дата публикации",
     )
+    # Счётчики поддерживаются сигналами (recipes.counters), расхождения
+    # исправляет команда recount.
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="В избранном",
+    )
+    cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="В корзинах",
+    )
+    # Название, ингредиенты и описание для полнотекстового поиска в
+    # PostgreSQL; GIN-индекс создаётся миграцией только для PostgreSQL.
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
-        ordering = ("-pub_date",)
+        ordering = ("-pub_date", "-id")
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"],
+                name="recipe_pub_date_id_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Имя картинки при загрузке: копии строятся, только если она
+        # изменилась.
+        instance._loaded_image = (
+            values[field_names.index("image")]
+            if "image" in field_names
+            else None
+        )
+        return instance
+
+
+class FeedEntry(models.Model):
+    "Рецепт в ленте подписок пользователя, записанный при публикации."
+
+    # Отдельный индекс не нужен: user - первое поле составного индекса.
+    user = models.ForeignKey(
+        User,
+        related_name="feed",
+        on_delete=models.CASCADE,
+        db_index=False,
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name="feed_entries",
+        on_delete=models.CASCADE,
+    )
+    author = models.ForeignKey(
+        User,
+        related_name="+",
+        on_delete=models.CASCADE,
+    )
+    # Копия даты публикации рецепта: лента читается по одному индексу.
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Записи лент"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "recipe"],
+                name="unique_feedentry",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-recipe"],
+                name="feedentry_user_pub_date_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.recipe}"
+
 
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(
@@ -170,3 +389,124 @@ class ShoppingCart(models.Model):
                 name="unique_shoppingcart",
             )
         ]
+
+
+class ShoppingListManager(models.Manager):
+    "Инкрементальное обновление сводных списков покупок."
+
+    def apply_deltas(self, deltas):
+        "Изменение количеств: deltas = {(user_id, ingredient_id): delta}."
+
+        rows = [(*key, delta) for key, delta in deltas.items() if delta]
+        if not rows:
+            return
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        columns = [
+            quote(self.model._meta.get_field(name).column)
+            for name in ("user", "ingredient", "total_amount")
+        ]
+        user, ingredient, total = columns
+        batch_size = connection.ops.bulk_batch_size(columns, rows)
+        # Вставка с ON CONFLICT вместо чтения существующих строк:
+        # параллельные изменения списка одного пользователя складываются,
+        # а не нарушают unique_shoppinglistitem.
+        with transaction.atomic(savepoint=False):
+            with connection.cursor() as cursor:
+                for start in range(0, len(rows), batch_size):
+                    batch = rows[start:start + batch_size]
+                    cursor.execute(
+                        f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+                        f"{', '.join(['(%s, %s, %s)'] * len(batch))} "
+                        f"ON CONFLICT ({user}, {ingredient}) DO UPDATE "
+                        f"SET {total} = {table}.{total} + EXCLUDED.{total}",
+                        [value for row in batch for value in row],
+                    )
+            self.filter(
+                user_id__in={row[0] for row in rows},
+                ingredient_id__in={row[1] for row in rows},
+                total_amount__lte=0,
+            ).delete()
+
+    def apply_recipe(self, user_id, recipe_id, sign=1):
+        "Добавление (sign=1) или вычитание (sign=-1) ингредиентов рецепта."
+
+        self.apply_recipes(user_id, [recipe_id], sign)
+
+    def apply_recipes(self, user_id, recipe_ids, sign=1):
+        "То же для нескольких рецептов одним запросом ингредиентов."
+
+        deltas = defaultdict(int)
+        for ingredient_id, amount in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list("ingredient_id", "amount"):
+            deltas[(user_id, ingredient_id)] += sign * amount
+        self.apply_deltas(deltas)
+
+    def apply_carts(self, carts, sign=1):
+        "То же для строк корзин queryset carts разных пользователей."
+
+        deltas = defaultdict(int)
+        for user_id, ingredient_id, amount in carts.order_by().values_list(
+            "user_id",
+            "recipe__recipe_ingredients__ingredient_id",
+            "recipe__recipe_ingredients__amount",
+        ):
+            if ingredient_id is not None:
+                deltas[(user_id, ingredient_id)] += sign * amount
+        self.apply_deltas(deltas)
+
+    def apply_recipe_change(self, recipe_id, old_amounts, new_amounts):
+        "Пересчёт списков всех, у кого рецепт в корзине, после его изменения."
+
+        changes = {
+            ingredient_id: new_amounts.get(ingredient_id, 0)
+            - old_amounts.get(ingredient_id, 0)
+            for ingredient_id in old_amounts.keys() | new_amounts.keys()
+        }
+        changes = {key: delta for key, delta in changes.items() if delta}
+        if not changes:
+            return
+        user_ids = ShoppingCart.objects.filter(
+            recipe_id=recipe_id
+        ).values_list("user_id", flat=True)
+        self.apply_deltas(
+            {
+                (user_id, ingredient_id): delta
+                for user_id in user_ids
+                for ingredient_id, delta in changes.items()
+            }
+        )
+
+
+class ShoppingListItem(models.Model):
+    "Сводный список покупок пользователя, обновляемый при изменении корзины."
+
+    user = models.ForeignKey(
+        User, related_name="shopping_list", on_delete=models.CASCADE
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        related_name="shopping_list_items",
+        on_delete=models.CASCADE,
+    )
+    # Не PositiveIntegerField: при вычитании значение может временно
+    # стать неположительным, такие строки удаляются.
+    total_amount = models.IntegerField(
+        verbose_name="Количество",
+    )
+
+    objects = ShoppingListManager()
+
+    class Meta:
+        verbose_name = "Сводный список покупок"
+        verbose_name_plural = "Сводные списки покупок"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ingredient"],
+                name="unique_shoppinglistitem",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.ingredient}"
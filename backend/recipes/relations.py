@@ -0,0 +1,110 @@
+from django.db import connection, transaction
+from django.utils import timezone
+
+from recipes import feed
+from recipes.counters import CART, FAVORITES, FOLLOWERS
+from recipes.models import ShoppingListItem
+
+
+class Relation:
+    """Связь пользователя с рецептом или автором: избранное, корзина,
+    подписка.
+
+    Добавление и удаление выполняются одним SQL-запросом без
+    предварительной проверки, результат определяется строками,
+    возвращёнными RETURNING (PostgreSQL, SQLite 3.35+), поэтому повторные
+    запросы не нарушают ограничения уникальности. Запросы идут в обход
+    сигналов, и счётчики, сводный список покупок и ленты обновляются
+    здесь же.
+    """
+
+    def __init__(self, counter, owner, on_change=None):
+        self.counter = counter
+        self.model = counter.related
+        self.owner = owner
+        self.target = counter.key
+        # Обновление зависимых данных: (owner_id, target_ids, sign).
+        self.on_change = on_change
+
+    def column(self, name):
+        return connection.ops.quote_name(
+            self.model._meta.get_field(name).column
+        )
+
+    def changed(self, owner_id, target_ids, sign):
+        self.counter.change_many(target_ids, sign)
+        if self.on_change is not None:
+            self.on_change(owner_id, target_ids, sign)
+
+    def execute(self, owner_id, sql, params, sign):
+        "Запрос с RETURNING id целей и обновление зависимых данных."
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            target_ids = {row[0] for row in cursor.fetchall()}
+            if target_ids:
+                self.changed(owner_id, target_ids, sign)
+        return target_ids
+
+    def add_many(self, owner_id, target_ids):
+        "Добавление связей; возвращает id целей, для которых их не было."
+
+        quote = connection.ops.quote_name
+        meta = self.model._meta
+        target = self.counter.model._meta
+        columns = [self.column(self.owner), self.column(self.target)]
+        values = ["%s", quote(target.pk.column)]
+        params = [owner_id]
+        for field in meta.concrete_fields:
+            # Например, дата создания подписки: auto_now_add не
+            # срабатывает без save().
+            if getattr(field, "auto_now_add", False):
+                columns.append(quote(field.column))
+                values.append("%s")
+                params.append(
+                    field.get_db_prep_save(timezone.now(), connection)
+                )
+        # Вставка из SELECT по целям: удалённые рецепты или авторы
+        # пропускаются, а не дают ошибку внешнего ключа.
+        sql = (
+            f"{connection.ops.insert_statement(ignore_conflicts=True)} "
+            f"{quote(meta.db_table)} ({', '.join(columns)}) "
+            f"SELECT {', '.join(values)} FROM {quote(target.db_table)} "
+            f"WHERE {quote(target.pk.column)} IN "
+            f"({', '.join(['%s'] * len(target_ids))}) "
+            f"{connection.ops.ignore_conflicts_suffix_sql(True)} "
+            f"RETURNING {self.column(self.target)}"
+        )
+        return self.execute(owner_id, sql, [*params, *target_ids], 1)
+
+    def remove_many(self, owner_id, target_ids):
+        "Удаление связей; возвращает id целей, для которых они были."
+
+        sql = (
+            "DELETE FROM "
+            f"{connection.ops.quote_name(self.model._meta.db_table)} "
+            f"WHERE {self.column(self.owner)} = %s "
+            f"AND {self.column(self.target)} IN "
+            f"({', '.join(['%s'] * len(target_ids))}) "
+            f"RETURNING {self.column(self.target)}"
+        )
+        return self.execute(owner_id, sql, [owner_id, *target_ids], -1)
+
+    def add(self, owner_id, target_id):
+        "Добавление связи; False, если она уже есть или цели нет."
+
+        return bool(self.add_many(owner_id, [target_id]))
+
+    def remove(self, owner_id, target_id):
+        "Удаление связи; False, если её не было."
+
+        return bool(self.remove_many(owner_id, [target_id]))
+
+
+favorites = Relation(FAVORITES, "user")
+shopping_cart = Relation(
+    CART, "user", on_change=ShoppingListItem.objects.apply_recipes
+)
+subscriptions = Relation(
+    FOLLOWERS, "subscriber", on_change=feed.apply_subscriptions
+)
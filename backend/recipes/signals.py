@@ -0,0 +1,126 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from recipes import feed
+from recipes.counters import CART, COUNTER_BY_RELATED, FAVORITES
+from recipes.images import schedule_variants
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListItem)
+from users.models import Subscription, User
+
+# Поля, от которых зависит поисковый вектор рецепта.
+SEARCH_FIELDS = {"name", "text"}
+
+# Отправляется командами импорта после массовой загрузки справочника,
+# так как bulk_create не вызывает post_save. sender - модель справочника.
+catalog_imported = Signal()
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(instance, created, **kwargs):
+    "Добавление ингредиентов рецепта в сводный список покупок."
+
+    if created:
+        ShoppingListItem.objects.apply_recipe(
+            instance.user_id, instance.recipe_id
+        )
+
+
+# У Favorite и ShoppingCart нет обработчиков удаления: их строки
+# удаляются каскадом одним DELETE, а счётчики и списки покупок
+# обновляются сгруппированными запросами при удалении рецепта или
+# пользователя. Отдельные связи удаляются через recipes.relations.
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_from_shopping_lists(instance, **kwargs):
+    "Вычитание ингредиентов удаляемого рецепта из списков покупок."
+
+    # pre_delete: ингредиенты рецепта ещё не удалены каскадом. Счётчики
+    # самого рецепта не нужны.
+    ShoppingListItem.objects.apply_carts(
+        ShoppingCart.objects.filter(recipe=instance), sign=-1
+    )
+
+
+@receiver(pre_delete, sender=User)
+def release_user_relations(instance, **kwargs):
+    "Уменьшение счётчиков рецептов из избранного и корзины пользователя."
+
+    # Список покупок пользователя удаляется вместе с ним.
+    FAVORITES.subtract(Favorite.objects.filter(user=instance))
+    CART.subtract(ShoppingCart.objects.filter(user=instance))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Subscription)
+def increment_counter(sender, instance, created, raw, **kwargs):
+    "Увеличение счётчика при добавлении связи."
+
+    if created and not raw:
+        COUNTER_BY_RELATED[sender].increment(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Subscription)
+def decrement_counter(sender, instance, **kwargs):
+    "Уменьшение счётчика при удалении рецепта или подписки."
+
+    COUNTER_BY_RELATED[sender].decrement(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def push_to_feeds(instance, created, raw, **kwargs):
+    "Рассылка нового рецепта по лентам подписчиков."
+
+    if created and not raw:
+        feed.push_recipe(instance)
+
+
+@receiver(post_save, sender=Subscription)
+def add_to_feed(instance, created, raw, **kwargs):
+    "Добавление рецептов автора в ленту нового подписчика."
+
+    if created and not raw:
+        feed.apply_subscriptions(instance.subscriber_id, [instance.author_id])
+
+
+@receiver(post_delete, sender=Subscription)
+def remove_from_feed(instance, **kwargs):
+    "Удаление рецептов автора из ленты бывшего подписчика."
+
+    feed.apply_subscriptions(
+        instance.subscriber_id, [instance.author_id], sign=-1
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def build_image_variants(instance, **kwargs):
+    "Построение уменьшенных копий новой или заменённой картинки рецепта."
+
+    schedule_variants(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(instance, update_fields, **kwargs):
+    "Пересчёт поискового вектора после сохранения рецепта."
+
+    if update_fields is not None and not SEARCH_FIELDS & set(update_fields):
+        return
+    # После фиксации транзакции, когда ингредиенты рецепта уже записаны.
+    recipe_id = instance.pk
+    transaction.on_commit(
+        lambda: Recipe.objects.filter(pk=recipe_id).update_search_vector()
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_search_vectors(instance, created, **kwargs):
+    "Пересчёт векторов рецептов с переименованным ингредиентом."
+
+    if created:
+        return
+    Recipe.objects.filter(ingredients=instance).update_search_vector()
@@ -0,0 +1,150 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingListItem)
+from users.models import User
+
+
+def create_user(username):
+    return User.objects.create(
+        username=username,
+        email=f"{username}@example.com",
+        first_name=username,
+        last_name=username,
+    )
+
+
+@override_settings(RECIPES_CACHE_ENABLED=False, IMAGE_VARIANTS_ENABLED=False)
+class ShoppingListTests(TestCase):
+    "Инкрементальное обновление сводных списков покупок."
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user("author")
+        cls.users = [create_user(f"user{i}") for i in range(5)]
+        cls.salt, cls.flour = (
+            Ingredient.objects.create(name=name, measurement_unit="г")
+            for name in ("Соль", "Мука")
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author,
+            name="Хлеб",
+            text="Хлеб",
+            image="recipes/images/test.png",
+            cooking_time=60,
+        )
+        RecipeIngredient.objects.bulk_create(
+            [
+                RecipeIngredient(
+                    recipe=cls.recipe, ingredient=cls.salt, amount=5
+                ),
+                RecipeIngredient(
+                    recipe=cls.recipe, ingredient=cls.flour, amount=500
+                ),
+            ]
+        )
+
+    def get_list(self, user):
+        return dict(
+            user.shopping_list.values_list("ingredient_id", "total_amount")
+        )
+
+    def test_apply_deltas(self):
+        user = self.users[0]
+        ShoppingListItem.objects.apply_deltas({(user.id, self.salt.id): 5})
+        ShoppingListItem.objects.apply_deltas(
+            {
+                (user.id, self.salt.id): 3,
+                (user.id, self.flour.id): -100,
+            }
+        )
+        self.assertEqual(self.get_list(user), {self.salt.id: 8})
+        ShoppingListItem.objects.apply_deltas({(user.id, self.salt.id): -8})
+        self.assertEqual(self.get_list(user), {})
+
+    def test_recipe_delete_updates_lists(self):
+        for user in self.users:
+            ShoppingCart.objects.create(user=user, recipe=self.recipe)
+            Favorite.objects.create(user=user, recipe=self.recipe)
+        self.assertEqual(
+            self.get_list(self.users[0]),
+            {self.salt.id: 5, self.flour.id: 500},
+        )
+        self.recipe.delete()
+        self.assertFalse(ShoppingListItem.objects.exists())
+        self.assertFalse(ShoppingCart.objects.exists())
+        self.assertFalse(Favorite.objects.exists())
+
+    def count_delete_queries(self, users):
+        "Число запросов удаления рецепта в корзине и избранном users."
+
+        recipe = Recipe.objects.create(
+            author=self.author,
+            name="Суп",
+            text="Суп",
+            image="recipes/images/test.png",
+            cooking_time=30,
+        )
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=self.salt, amount=1
+        )
+        for user in users:
+            ShoppingCart.objects.create(user=user, recipe=recipe)
+            Favorite.objects.create(user=user, recipe=recipe)
+        with CaptureQueriesContext(connection) as context:
+            recipe.delete()
+        return len(context.captured_queries)
+
+    def test_recipe_delete_queries_do_not_depend_on_relations(self):
+        self.assertEqual(
+            self.count_delete_queries(self.users[:1]),
+            self.count_delete_queries(self.users),
+        )
+
+    def test_user_delete_updates_counters(self):
+        user = self.users[0]
+        ShoppingCart.objects.create(user=user, recipe=self.recipe)
+        Favorite.objects.create(user=user, recipe=self.recipe)
+        ShoppingCart.objects.create(user=self.users[1], recipe=self.recipe)
+        user.delete()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+        self.assertEqual(self.recipe.cart_count, 1)
+        self.assertEqual(
+            self.get_list(self.users[1]),
+            {self.salt.id: 5, self.flour.id: 500},
+        )
+
+    def test_admin_cannot_move_relations(self):
+        admin = create_user("admin")
+        admin.is_staff = admin.is_superuser = True
+        admin.save()
+        self.client.force_login(admin)
+        user, other = self.users[:2]
+        recipe = Recipe.objects.create(
+            author=self.author,
+            name="Суп",
+            text="Суп",
+            image="recipes/images/test.png",
+            cooking_time=30,
+        )
+        for model in (ShoppingCart, Favorite):
+            with self.subTest(model=model.__name__):
+                relation = model.objects.create(user=user, recipe=self.recipe)
+                response = self.client.post(
+                    f"/admin/recipes/{model._meta.model_name}/"
+                    f"{relation.pk}/change/",
+                    {"user": other.pk, "recipe": recipe.pk},
+                )
+                self.assertEqual(response.status_code, 302)
+                relation.refresh_from_db()
+                self.assertEqual(
+                    (relation.user_id, relation.recipe_id),
+                    (user.pk, self.recipe.pk),
+                )
+        self.assertEqual(
+            self.get_list(user), {self.salt.id: 5, self.flour.id: 500}
+        )
+        self.assertEqual(self.get_list(other), {})
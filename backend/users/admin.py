@@ -4,7 +4,15 @@ from .models import Subscription, User
 
 
 class UserAdmin(auth.admin.UserAdmin):
-    list_display = ("pk", "username", "email", "first_name", "last_name")
+    list_display = (
+        "pk",
+        "username",
+        "email",
+        "first_name",
+        "last_name",
+        "recipes_count",
+        "followers_count",
+    )
     # fields = ('username', 'email', 'first_name',
     #           'last_name', 'password', 'is_active')
     fieldsets = (
@@ -33,12 +41,27 @@ class UserAdmin(auth.admin.UserAdmin):
             },
         ),
     )
-    list_filter = ("email", "username")
+    list_filter = ("is_staff", "is_active")
+    # Поиск без учёта регистра в PostgreSQL идёт по индексам на UPPER от
+    # полей (миграция 0003_user_search_indexes).
+    search_fields = ("=username", "=email", "^last_name")
+    show_full_result_count = False
 
 
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ("pk", "subscriber", "author", "created")
+    list_select_related = ("subscriber", "author")
     fields = ("subscriber", "author")
+    autocomplete_fields = ("subscriber", "author")
+    search_fields = ("=subscriber__username", "=author__username")
+    show_full_result_count = False
+
+    def get_readonly_fields(self, request, obj=None):
+        # Лента и счётчики следуют за созданием и удалением подписки,
+        # а не за правкой её полей.
+        if obj is not None:
+            return self.fields
+        return super().get_readonly_fields(request, obj)
 
 
 admin.site.register(User, UserAdmin)
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# Поиск в админке ("=" и "^") сравнивает UPPER(поле::text) через = и LIKE:
+# обычные индексы по полям для него не подходят. text_pattern_ops нужен
+# для LIKE по префиксу и годится для равенства. Только PostgreSQL.
+INDEXES = {
+    "user_username_upper_idx": "username",
+    "user_email_upper_idx": "email",
+    "user_last_name_upper_idx": "last_name",
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, column in INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX {name} ON users_user "
+            f"(UPPER({column}::text) text_pattern_ops)"
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
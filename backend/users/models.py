@@ -16,6 +16,17 @@ class User(AbstractUser):
     password = models.CharField(
         max_length=150,
     )
+    # Счётчики поддерживаются сигналами (recipes.counters).
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Рецептов",
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Подписчиков",
+    )
 
     REQUIRED_FIELDS = [
         "email",